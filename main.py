@@ -6,6 +6,8 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from tools.database import init_db
+from tools.exam_pool import exam_pool
+from tools.stats_aggregator import stats_aggregator
 from routers import auth, users, exams, questions, stats, results
 
 #####################################################################
@@ -28,6 +30,16 @@ templates = Jinja2Templates(directory="templates")
 @app.on_event("startup")
 def on_startup():
     init_db()
+    # Hazır sınav kağıdı havuzunu doldurmaya başla
+    exam_pool.start()
+    # İstatistikleri bellekte toplayıp periyodik olarak yazan thread
+    stats_aggregator.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    exam_pool.stop()
+    # Bekleyen istatistik deltalarını kapanmadan önce yaz
+    stats_aggregator.stop()
 
 # Mevcut Router’lar (API’ler)
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
@@ -1,19 +1,24 @@
 # routers/exams.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from datetime import datetime
 from typing import Dict, List, Optional
 from pydantic import BaseModel
-from uuid import UUID
+from uuid import UUID, uuid4
 from tools.database import get_db
-from tools.models import User, Exam, Question, exam_question_association
-from tools.exam import select_questions, process_results
+from tools.models import User, Exam, exam_question_association
+from tools.exam import process_results, exam_sections, find_open_exam, serialize_questions
+from tools.exam_pool import exam_pool, generate_paper
 from tools.token_generator import get_current_user
 
 router = APIRouter()
 
 class ChoiceAnswer(BaseModel):
-    # "choice_text" (tekil) veya "ordered_list" (ordering için)
+    # Tercih edilen: /exams/start cevabındaki "choice_id" değerleri.
+    # ordering tipinde id'ler kullanıcının sıralamasıyla gönderilir.
+    choice_ids: Optional[List[UUID]] = None
+    # Eski istemciler için: "choice_text" (tekil) veya "ordered_list" (ordering için)
     # Burada basit bir örnek: multiple ise list[str], single/tf => tek str
     selected_texts: Optional[List[str]] = None
     # ordering tipinde mesela kullanıcı "1,2,3,4" gibi
@@ -34,56 +39,54 @@ def start_exam_endpoint(db: Session = Depends(get_db), current_user: User = Depe
     if current_user.attempts >= 2:
         raise HTTPException(status_code=400, detail="You have no remaining exam attempts.")
 
-    selected_questions = select_questions(db, current_user)
-    if not selected_questions:
+    # Aynı öğrencinin eşzamanlı start isteklerini sıraya sok (kullanıcı satırı kilidi)
+    db.query(User).filter(User.user_id == current_user.user_id).with_for_update().first()
+
+    # Sayfa yenilendiyse yeni sınav açma, açık sınavı aynı kağıtla geri döndür
+    open_exam = find_open_exam(db, current_user)
+    if open_exam is not None:
+        payload = serialize_questions(exam_sections(db, open_exam))
+        db.commit()
+        content = '{"message": "Exam resumed", "exam_id": "%s", "questions": %s}' % (open_exam.exam_id, payload)
+        return Response(content=content, media_type="application/json")
+
+    # Önce havuzdan hazır bir kağıt dene, yoksa canlı örnekle
+    paper = exam_pool.claim() or generate_paper(db)
+    if paper is None:
         raise HTTPException(status_code=400, detail="No questions available.")
 
-    # Create Exam
+    # Exam satırı ve tüm exam_question_association satırları tek transaction'da:
+    # 1 INSERT (exams) + 1 çok satırlı INSERT (association) + COMMIT.
+    # Compact kağıtta association yazılmaz, sorular exams.question_seqs'ten okunur.
+    exam_id = uuid4()
     exam = Exam(
+        exam_id=exam_id,
         user_id=current_user.user_id,
         class_name=current_user.class_name,
         school_id=current_user.school_id,
-        start_time=datetime.utcnow()
+        start_time=datetime.utcnow(),
+        question_seqs=paper.question_seqs
     )
     db.add(exam)
-    db.commit()
-    db.refresh(exam)
+    db.flush()
 
     # Associate selected questions
-    all_selected = []
-    for qs in selected_questions.values():
-        all_selected.extend(qs)
-    exam.selected_questions = all_selected
+    if paper.question_seqs is None:
+        db.execute(insert(exam_question_association).values([
+            {"exam_id": exam_id, "question_id": qid} for qid in paper.question_ids
+        ]))
     db.commit()
 
-    # Geri dönerken, her question'ın question_choices’larını da verelim:
-    # (UI tarafta “Şıklar”'ı gösterebilmek için.)
-    response_questions = {}
-    for sec, qs in selected_questions.items():
-        qlist = []
-        for q in qs:
-            # question_choices tablosundan verileri
-            qc_list = []
-            for choice_row in q.question_choices:
-                qc_list.append({
-                    "choice_id": str(choice_row.id),
-                    "choice_text": choice_row.choice_text
-                })
-            qlist.append({
-                "question_id": str(q.id),
-                "external_id": q.external_id,
-                "question": q.question,
-                "points": q.points,
-                "type": q.type,
-                "choices": qc_list
-            })
-        response_questions[sec] = qlist
-
-    return {
-        "message": "Exam started",
-        "exam_id": exam.exam_id,
-        "questions": response_questions
-    }
+    # "questions" kısmı kağıtta zaten JSON olarak hazır, sadece birleştiriyoruz
+    content = '{"message": "Exam started", "exam_id": "%s", "questions": %s}' % (exam_id, paper.payload)
+    return Response(content=content, media_type="application/json")
+
+
+@router.get("/pool", summary="Exam paper pool status")
+def exam_pool_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view the exam pool.")
+    return exam_pool.stats()
 
 
 @router.post("/submit", response_model=SubmitExamResponse, summary="Submit exam answers")
@@ -97,20 +100,17 @@ def submit_exam_endpoint(
     if current_user.attempts >= 2:
         raise HTTPException(status_code=400, detail="You have no remaining exam attempts.")
 
-    exam = db.query(Exam).filter(Exam.exam_id == body.exam_id, Exam.user_id == current_user.user_id).first()
+    # Aynı sınavın eşzamanlı gönderimleri sıraya girer; ikincisi end_time'ı dolu görür
+    exam = db.query(Exam).filter(
+        Exam.exam_id == body.exam_id, Exam.user_id == current_user.user_id
+    ).with_for_update().first()
     if not exam:
         raise HTTPException(status_code=404, detail="Exam not found.")
     if exam.end_time is not None:
         raise HTTPException(status_code=400, detail="Exam has already been submitted.")
 
     # selected_questions
-    def get_selected_questions_for_exam(db: Session, exam: Exam):
-        selected_qs = db.query(Question).join(exam_question_association).filter(
-            exam_question_association.c.exam_id == exam.exam_id
-        ).all()
-        return selected_qs
-
-    selected_qs = get_selected_questions_for_exam(db, exam)
+    selected_qs = [q for qs in exam_sections(db, exam).values() for q in qs]
     if not selected_qs:
         raise HTTPException(status_code=400, detail="No questions associated with this exam.")
 
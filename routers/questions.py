@@ -3,10 +3,12 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from uuid import uuid4
+from uuid import UUID, uuid4
 from tools.database import get_db
 from tools.models import User, Question, QuestionChoice
 from tools.token_generator import get_current_user
+from tools.question_cache import question_bank
+from tools.item_analysis import item_analysis
 
 router = APIRouter()
 
@@ -47,6 +49,21 @@ class QuestionResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class ItemAnalysisResponse(BaseModel):
+    question_id: str
+    external_id: str
+    section: int
+    q_type: str
+    responses: int
+    # Zorluk: tam puan alanların oranı (cevap yoksa None)
+    p_value: Optional[float]
+    # Ayırt edicilik: düzeltilmiş point-biserial korelasyon (tanımsızsa None)
+    point_biserial: Optional[float]
+
+class RefreshQuestionCacheRequest(BaseModel):
+    # Cevap anahtarı düzeltilen sorular; boşsa tüm banka bir sonraki okumada yeniden yüklenir
+    question_ids: List[UUID] = []
+
 # ========= Endpoints =========
 @router.post("/", response_model=AddQuestionResponse, summary="Add a new question (advanced DB schema)")
 def add_question(
@@ -82,6 +99,9 @@ def add_question(
         db.add(qc)
         db.commit()
 
+    # Soru bankası cache'ini güncelle (yalnızca bu soru yeniden okunur)
+    question_bank.refresh_question(db, new_q.id)
+
     return {
         "message": "Question added successfully with new DB schema",
         "external_id": external_id
@@ -115,3 +135,45 @@ def list_all_questions(
             choices=choice_list
         ))
     return results
+
+@router.get("/analysis", response_model=List[ItemAnalysisResponse], summary="Question difficulty and discrimination")
+def question_analysis(
+    section: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role not in ["teacher", "admin"]:
+        raise HTTPException(status_code=403, detail="Only teachers or admins can view question analysis.")
+
+    # Tüm banka için toplu hesaplanır ve bir süre cache'lenir
+    results = item_analysis.get(db)
+    return [
+        ItemAnalysisResponse(
+            question_id=str(r.question_id),
+            external_id=r.external_id,
+            section=r.section,
+            q_type=r.type,
+            responses=r.responses,
+            p_value=r.p_value,
+            point_biserial=r.point_biserial
+        )
+        for r in results
+        if section is None or r.section == section
+    ]
+
+@router.post("/cache/refresh", summary="Reload questions / answer keys into this worker's cache")
+def refresh_question_cache(
+    body: RefreshQuestionCacheRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can refresh the question cache.")
+
+    # Yalnızca isteği alan process'in cache'i yenilenir; diğer worker'lar TTL ile yakalar
+    if body.question_ids:
+        for question_id in body.question_ids:
+            question_bank.refresh_question(db, question_id)
+    else:
+        question_bank.invalidate()
+    return {"refreshed": len(body.question_ids) or "all", "version": question_bank.version}
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List
 from pydantic import BaseModel
 
 from tools.database import get_db
-from tools.models import User, Exam, ExamAnswer, Question, QuestionChoice
+from tools.models import User, Exam
 from tools.token_generator import get_current_user
+from tools.leaderboard import leaderboards
+from tools.exam_summary import load_summaries
+from tools.results_cache import results_cache
 
 router = APIRouter()
 
@@ -17,16 +20,46 @@ class AnswerDetail(BaseModel):
     is_correct: bool
     points_earned: int
 
+class SectionSummary(BaseModel):
+    correct: int
+    wrong: int
+    score: int
+
 class ExamDetail(BaseModel):
     exam_id: str
     start_time: str
     end_time: str | None
     score_avg: float
+    sections: Dict[str, SectionSummary]
     answers: List[AnswerDetail]
 
 class ExamResultResponse(BaseModel):
     exams: List[ExamDetail]
 
+class RankResponse(BaseModel):
+    rank: int
+    class_size: int
+    percentile: float
+    score_avg: float
+
+@router.get("/rank", response_model=RankResponse, summary="Your rank in your class")
+def view_class_rank(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "student":
+        raise HTTPException(status_code=403, detail="Only students can view their class rank.")
+
+    rank = leaderboards.rank(db, current_user.school_id, current_user.class_name, current_user.user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="No completed exams yet.")
+    return RankResponse(
+        rank=rank.rank,
+        class_size=rank.class_size,
+        percentile=rank.percentile,
+        score_avg=rank.score
+    )
+
 @router.get("/results", response_model=ExamResultResponse, summary="View your exam results")
 def view_exam_results(
     db: Session = Depends(get_db),
@@ -35,48 +68,46 @@ def view_exam_results(
     if current_user.role != "student":
         raise HTTPException(status_code=403, detail="Only students can view their exam results.")
 
-    exams = db.query(Exam).filter(Exam.user_id == current_user.user_id).all()
-    if not exams:
-        return {"exams": []}
+    cached = results_cache.get(current_user)
+    if cached is not None:
+        return cached
+
+    # Sonuçlar notlandırmada yazılan Exam.summary'den okunur; özeti olmayan eski
+    # sınavlar için özet tablolardan tek sorguda kurulur (en fazla 2 sorgu).
+    exams = db.query(Exam).filter(Exam.user_id == current_user.user_id).order_by(Exam.start_time).all()
+
+    missing = load_summaries(db, [exam.exam_id for exam in exams if exam.summary is None])
 
     exam_details = []
     for exam in exams:
-        exam_answers = db.query(ExamAnswer).filter(ExamAnswer.exam_id == exam.exam_id).all()
-        answers_out = []
-
-        for ans in exam_answers:
-            # Soru tablosundan asıl soruyu bul
-            question_obj = db.query(Question).filter(Question.id == ans.question_id).first()
-            if not question_obj:
-                continue
-
-            # Kullanıcının işaretlediği choice_text'leri al
-            user_choices = ans.user_choices  # birden çok olabilir
-            chosen_texts = []
-            for uc in user_choices:
-                qc = db.query(QuestionChoice).filter(QuestionChoice.id == uc.question_choice_id).first()
-                if qc:
-                    chosen_texts.append(qc.choice_text)
-
-            # 'is_correct' hesaplayalım. Basitçe 'kazandığı puan == soru puanı' kontrolü
-            # (Tabii bu her soru tipi için "tam puan = doğru" mantığına dayanıyor)
-            is_correct = (ans.points_earned == question_obj.points)
-
-            answers_out.append(AnswerDetail(
-                question_id=str(question_obj.id),
-                external_id=question_obj.external_id,
-                question=question_obj.question,
-                user_answer=", ".join(chosen_texts),
-                is_correct=is_correct,
-                points_earned=ans.points_earned
-            ))
+        summary = exam.summary if exam.summary is not None else missing[exam.exam_id]
+        answers_out = [
+            AnswerDetail(
+                question_id=a["question_id"],
+                external_id=a["external_id"],
+                question=a["question"],
+                user_answer=", ".join(a["chosen"]),
+                is_correct=a["is_correct"],
+                points_earned=a["points_earned"]
+            )
+            for a in summary["answers"]
+        ]
 
         exam_details.append(ExamDetail(
             exam_id=str(exam.exam_id),
             start_time=exam.start_time.isoformat(),
             end_time=exam.end_time.isoformat() if exam.end_time else None,
             score_avg=current_user.score_avg,
+            sections=summary["sections"],
             answers=answers_out
         ))
 
-    return {"exams": exam_details}
+    response = ExamResultResponse(exams=exam_details)
+    results_cache.put(current_user, response)
+    return response
+
+@router.get("/results/cache", summary="Results cache status")
+def results_cache_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view the results cache.")
+    return results_cache.stats()
@@ -1,11 +1,21 @@
 # routers/stats.py
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from uuid import UUID
 from pydantic import BaseModel
 from tools.database import get_db
-from tools.models import User, Statistics
+from tools.models import User, School
 from tools.token_generator import get_current_user
+from tools.stats_aggregator import stats_aggregator
+from tools.leaderboard import leaderboards
+from tools.class_results import class_results_cache
+from tools.results_export import csv_stream, ndjson_stream
+from tools.statistics_utils import (
+    statistics_rollup, bucket_rollup, histogram_rollup, histogram_percentile, histogram_distribution, to_utc_naive
+)
 
 router = APIRouter()
 
@@ -17,35 +27,225 @@ class StatisticResponse(BaseModel):
     wrong_questions: int
     average_score: float
     section_percentage: float
+    # Sınav başına section başarı yüzdesinin yüzdelikleri ve 10'ar puanlık dağılımı
+    # (yalnızca tarih aralığı verilmediğinde; histogram tüm zamanlar için tutuluyor)
+    p10: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    distribution: Optional[List[int]] = None
 
 @router.get("/", response_model=List[StatisticResponse], summary="View statistics")
-def view_statistics(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def view_statistics(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # start / end verilirse [start, end) aralığı saatlik/günlük dilimlerden hesaplanır,
+    # verilmezse tüm zamanların toplamı döner.
     if current_user.role not in ["teacher", "admin"]:
         raise HTTPException(status_code=403, detail="Only teachers or admins can view statistics.")
 
-    if current_user.role == "admin":
-        stats = db.query(Statistics).all()
-
-    elif current_user.role == "teacher":
+    filters = {}
+    if current_user.role == "teacher":
         if not current_user.registered_section:
             raise HTTPException(status_code=400, detail="Teacher has no registered section.")
 
-        stats = db.query(Statistics).filter(
-            Statistics.school_id == current_user.school_id,
-            Statistics.class_name == current_user.class_name,
+        filters = {
+            "school_id": current_user.school_id,
+            "class_name": current_user.class_name,
             # teacher’ın registered_section’ı “1” gibi bir string ise int() alabilirsiniz
-            Statistics.section_number == int(current_user.registered_section)
-        ).all()
+            "section_number": int(current_user.registered_section)
+        }
+
+    # Sayaçlar shard'lara bölünmüş durumda; her (okul, sınıf, section) için toplanır
+    histograms = {}
+    if start is None and end is None:
+        stats = statistics_rollup(db, **filters)
+        histograms = histogram_rollup(db, **filters)
+    else:
+        start = to_utc_naive(start) if start else datetime(1970, 1, 1)
+        end = to_utc_naive(end) if end else datetime.utcnow()
+        if start >= end:
+            raise HTTPException(status_code=400, detail="start must be before end.")
+        stats = bucket_rollup(db, start, end, **filters)
 
-    return [
-        StatisticResponse(
+    response = []
+    for s in stats:
+        counts = histograms.get((s.school_id, s.class_name, s.section_number))
+        response.append(StatisticResponse(
             school_id=str(s.school_id),
             class_name=s.class_name,
             section_number=s.section_number,
             correct_questions=s.correct_questions,
             wrong_questions=s.wrong_questions,
             average_score=s.average_score,
-            section_percentage=s.section_percentage
-        )
-        for s in stats
-    ]
+            section_percentage=s.section_percentage,
+            p10=histogram_percentile(counts, 0.1) if counts else None,
+            p50=histogram_percentile(counts, 0.5) if counts else None,
+            p90=histogram_percentile(counts, 0.9) if counts else None,
+            distribution=histogram_distribution(counts) if counts else None
+        ))
+    return response
+
+class LeaderboardEntryResponse(BaseModel):
+    rank: int
+    user_id: str
+    username: str
+    full_name: str
+    score_avg: float
+
+class LeaderboardResponse(BaseModel):
+    school_id: str
+    class_name: str
+    class_size: int
+    entries: List[LeaderboardEntryResponse]
+
+@router.get("/leaderboard", response_model=LeaderboardResponse, summary="Class leaderboard")
+def view_leaderboard(
+    limit: int = 10,
+    school_id: Optional[UUID] = None,
+    class_name: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # Öğretmen kendi sınıfını görür, admin school_id + class_name vermeli
+    if current_user.role == "teacher":
+        school_id, class_name = current_user.school_id, current_user.class_name
+    elif current_user.role == "admin":
+        if school_id is None or not class_name:
+            raise HTTPException(status_code=400, detail="school_id and class_name are required.")
+    else:
+        raise HTTPException(status_code=403, detail="Only teachers or admins can view the leaderboard.")
+    if limit < 1 or limit > 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100.")
+
+    class_size, entries = leaderboards.top(db, school_id, class_name, limit)
+    return LeaderboardResponse(
+        school_id=str(school_id),
+        class_name=class_name,
+        class_size=class_size,
+        entries=[
+            LeaderboardEntryResponse(
+                rank=e.rank,
+                user_id=e.user_id,
+                username=e.username,
+                full_name=e.full_name,
+                score_avg=e.score
+            )
+            for e in entries
+        ]
+    )
+
+class ExamSectionResultResponse(BaseModel):
+    exam_id: str
+    attempt: int
+    end_time: str
+    correct: int
+    wrong: int
+    score: int
+
+class StudentResultResponse(BaseModel):
+    user_id: str
+    username: str
+    full_name: str
+    score_avg: Optional[float]
+    exams: List[ExamSectionResultResponse]
+
+class ClassResultsResponse(BaseModel):
+    school_id: str
+    class_name: str
+    section_number: int
+    page: int
+    page_size: int
+    total: int
+    students: List[StudentResultResponse]
+
+@router.get("/class_results", response_model=ClassResultsResponse, summary="Per-student results of a class")
+def view_class_results(
+    page: int = 1,
+    page_size: int = 50,
+    school_id: Optional[UUID] = None,
+    class_name: Optional[str] = None,
+    section: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # Öğretmen kendi sınıfını ve section'ını görür, admin üçünü de vermeli
+    if current_user.role == "teacher":
+        if not current_user.registered_section:
+            raise HTTPException(status_code=400, detail="Teacher has no registered section.")
+        school_id, class_name = current_user.school_id, current_user.class_name
+        section = int(current_user.registered_section)
+    elif current_user.role == "admin":
+        if school_id is None or not class_name or section is None:
+            raise HTTPException(status_code=400, detail="school_id, class_name and section are required.")
+    else:
+        raise HTTPException(status_code=403, detail="Only teachers or admins can view class results.")
+    if page < 1:
+        raise HTTPException(status_code=400, detail="page must be at least 1.")
+    if page_size < 1 or page_size > 100:
+        raise HTTPException(status_code=400, detail="page_size must be between 1 and 100.")
+
+    result = class_results_cache.get(db, school_id, class_name, section, page, page_size)
+    return ClassResultsResponse(
+        school_id=str(school_id),
+        class_name=class_name,
+        section_number=section,
+        page=page,
+        page_size=page_size,
+        total=result.total,
+        students=[
+            StudentResultResponse(
+                user_id=str(s.user_id),
+                username=s.username,
+                full_name=s.full_name,
+                score_avg=s.score_avg,
+                exams=[
+                    ExamSectionResultResponse(
+                        exam_id=str(e.exam_id),
+                        attempt=e.attempt,
+                        end_time=e.end_time.isoformat(),
+                        correct=e.correct,
+                        wrong=e.wrong,
+                        score=e.score
+                    )
+                    for e in s.exams
+                ]
+            )
+            for s in result.students
+        ]
+    )
+
+EXPORT_FORMATS = {
+    "csv": (csv_stream, "text/csv", "csv"),
+    "ndjson": (ndjson_stream, "application/x-ndjson", "ndjson"),
+}
+
+@router.get("/export", summary="Stream all exam results of a school (CSV / NDJSON)")
+def export_results(
+    school_id: UUID,
+    format: str = "csv",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # Cevap başına bir satır; satırlar DB'den okundukça gönderilir (bkz. tools/results_export.py)
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can export results.")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'.")
+    if db.get(School, school_id) is None:
+        raise HTTPException(status_code=404, detail="School not found.")
+
+    stream, media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream(school_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="results_{school_id}.{extension}"'}
+    )
+
+@router.get("/aggregator", summary="Statistics write-behind aggregator status")
+def statistics_aggregator_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view the statistics aggregator.")
+    return stats_aggregator.stats()
@@ -183,16 +183,19 @@ async def student_submit_exam(
     form_data = await request.form()
     answers_payload = {}
     for key in form_data.keys():
-        if key.startswith("answer_"):
+        if key.startswith("choice_"):
+            # Şık id'si ile gelen cevaplar (radio / checkbox)
+            question_id = key.replace("choice_", "").replace("[]", "")
+            answers_payload.setdefault(question_id, {})["choice_ids"] = form_data.getlist(key)
+        elif key.startswith("answer_"):
             question_id = key.replace("answer_", "").replace("[]", "")  # '[]' karakterlerini kaldırıyoruz
             value_list = form_data.getlist(key)  # Seçilen tüm değerler (list)
-            answers_payload[question_id] = {
-                "selected_texts": value_list
-            }
+            answers_payload.setdefault(question_id, {})["selected_texts"] = value_list
     # Artık answers_payload dict'i, Pydantic modeline uygun şekilde:
     # {
     #    "question_id": {
-    #       "selected_texts": [ "A", "B" ]   // ya da tek seçim varsa [ "A" ]
+    #       "choice_ids": [ "<uuid>", ... ]       // radio / checkbox şıkları
+    #       "selected_texts": [ "3,1,4,2" ]       // ordering gibi serbest metin alanları
     #    },
     #    ...
     # }
@@ -233,7 +236,7 @@ def student_view_results(request: Request):
         if r.status_code == 200:
             data = r.json()
             return templates.TemplateResponse(
-                "student_view_results.html",
+                "student_view_result.html",
                 {
                     "request": request,
                     "results": data["exams"],
@@ -0,0 +1,65 @@
+# tests/test_batch_grader.py
+#
+# grade_batch, tek tek notlandırmayla (evaluate_question / evaluate_choice_ids) aynı sonucu
+# vermeli. Rastgele sorular ve seçimler üretilir; DB gerekmez (cevap anahtarı açıkça verilir).
+
+import random
+import uuid
+import pytest
+from tools.question_cache import CachedQuestion, CachedChoice
+from tools.answer_key import compile_answer_key
+from tools.exam import evaluate_question, evaluate_choice_ids
+from tools.batch_grader import encode_texts, encode_choice_ids, grade_batch
+
+QUESTION_TYPES = ["single_choice", "true_false", "multiple_choice", "ordering", "essay"]
+# Normalize edilince çakışan metinler de var (" a " / "A", "  B" / "b")
+TEXTS = ["A", "b", " a ", "C", "d", "E"]
+
+
+def random_question(rng, q_type):
+    choices = []
+    for i in range(rng.randint(0, 6)):
+        correct_position = rng.choice([None, 0, 1, 2, 3, i, -1]) if q_type == "ordering" else None
+        choices.append(CachedChoice(uuid.uuid4(), rng.choice(TEXTS), rng.random() < 0.4, correct_position))
+    return CachedQuestion(
+        id=uuid.uuid4(),
+        external_id="test",
+        section=1,
+        question="?",
+        points=rng.choice([1, 3, 5, 7, 10]),
+        type=q_type,
+        seq=0,
+        question_choices=tuple(choices)
+    )
+
+
+def as_pairs(points, is_full):
+    return list(zip(points.tolist(), is_full.tolist()))
+
+
+@pytest.mark.parametrize("q_type", QUESTION_TYPES)
+def test_grade_batch_matches_evaluate_question(q_type):
+    rng = random.Random(q_type)
+    for _ in range(300):
+        q = random_question(rng, q_type)
+        key = compile_answer_key(q)
+        # Eşleşmeyen ("zzz"), tekrarlı ve boş seçimler dahil
+        selections = [
+            [rng.choice(TEXTS + ["zzz", "  B"]) for _ in range(rng.randint(0, 5))]
+            for _ in range(40)
+        ]
+        expected = [(points, bool(full)) for points, full in (evaluate_question(q, s, key) for s in selections)]
+        assert as_pairs(*grade_batch(q, key, encode_texts(key, selections))) == expected
+
+
+@pytest.mark.parametrize("q_type", QUESTION_TYPES)
+def test_grade_batch_matches_evaluate_choice_ids(q_type):
+    rng = random.Random(q_type)
+    for _ in range(300):
+        q = random_question(rng, q_type)
+        key = compile_answer_key(q)
+        # Bilinmeyen id'ler de gönderilir
+        ids = [c.id for c in q.question_choices] + [uuid.uuid4()]
+        selections = [[rng.choice(ids) for _ in range(rng.randint(0, 4))] for _ in range(40)]
+        expected = [(points, bool(full)) for points, full in (evaluate_choice_ids(q, s, key) for s in selections)]
+        assert as_pairs(*grade_batch(q, key, encode_choice_ids(key, selections))) == expected
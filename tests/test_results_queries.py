@@ -0,0 +1,155 @@
+# tests/test_results_queries.py
+#
+# /students/results sınav sayısından bağımsız sabit sayıda SQL çalıştırmalı:
+# özeti (Exam.summary) olan sınavlar tek sorguyla, özeti olmayan eski sınavlar
+# load_summaries'in tek sorgusuyla okunur.
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from uuid import uuid4
+import pytest
+from sqlalchemy import event, text
+from tools.database import engine
+from tools.models import School, User, Question, QuestionChoice, Exam, ExamAnswer, UserChoice
+from tools.exam_summary import rebuild_summaries
+from tools.results_cache import results_cache
+from routers.results import view_exam_results
+
+QUESTIONS_PER_EXAM = 20
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def school(db):
+    school = School(name=f"test-{uuid4()}")
+    db.add(school)
+    db.flush()
+    return school
+
+
+def make_questions(db, count: int):
+    questions = []
+    for i in range(count):
+        q = Question(external_id=f"test-{uuid4()}", section=i % 4 + 1, question=f"q{i}?", points=1,
+                     type="single_choice")
+        q.question_choices = [
+            QuestionChoice(choice_text="right", is_correct=True),
+            QuestionChoice(choice_text="wrong", is_correct=False),
+        ]
+        questions.append(q)
+    db.add_all(questions)
+    db.flush()
+    return questions
+
+
+@pytest.fixture
+def questions(db):
+    return make_questions(db, QUESTIONS_PER_EXAM)
+
+
+def make_student(db, school, papers) -> User:
+    """
+    Her kağıt (soru listesi) için bir kapanmış sınavı olan öğrenci;
+    her sınavda tüm sorular cevaplanmış ve özetlenmiş.
+    """
+    user = User(username=f"test-{uuid4()}", password="x", name="Test", surname="Student", role="student",
+                class_name="8-A", school_id=school.school_id, attempts=len(papers))
+    db.add(user)
+    db.flush()
+
+    started = datetime(2024, 1, 1)
+    for n, questions in enumerate(papers):
+        exam = Exam(user_id=user.user_id, class_name=user.class_name, school_id=school.school_id,
+                    start_time=started + timedelta(days=n), end_time=started + timedelta(days=n, hours=1))
+        db.add(exam)
+        db.flush()
+        for i, q in enumerate(questions):
+            chosen = q.question_choices[(i + n) % 2]
+            answer = ExamAnswer(exam_id=exam.exam_id, question_id=q.id,
+                                points_earned=q.points if chosen.is_correct else 0)
+            db.add(answer)
+            db.flush()
+            db.add(UserChoice(exam_answer_id=answer.id, question_choice_id=chosen.id))
+    db.flush()
+
+    exam_ids = [e.exam_id for e in db.query(Exam.exam_id).filter(Exam.user_id == user.user_id)]
+    rebuild_summaries(db, exam_ids)
+    return user
+
+
+def drop_summaries(db, user):
+    """Özetten önce kapanmış sınavlar gibi: summary NULL."""
+    db.execute(text("UPDATE exams SET summary = NULL WHERE user_id = :user_id"), {"user_id": user.user_id})
+
+
+def results_statements(db, user):
+    """view_exam_results'ın çalıştırdığı SQL sayısı ve cevabı (results cache devre dışı)."""
+    results_cache.clear()
+    db.expire_all()
+    db.refresh(user)
+    with count_statements() as statements:
+        response = view_exam_results(db=db, current_user=user)
+    results_cache.clear()
+    return len(statements), response
+
+
+def test_results_query_count_independent_of_exam_count(db, school, questions):
+    one = make_student(db, school, [questions])
+    many = make_student(db, school, [questions] * 6)
+
+    one_count, one_response = results_statements(db, one)
+    many_count, many_response = results_statements(db, many)
+
+    assert len(one_response.exams) == 1
+    assert len(many_response.exams) == 6
+    assert all(len(e.answers) == QUESTIONS_PER_EXAM for e in many_response.exams)
+    assert one_count == many_count == 1
+
+
+def test_results_query_count_without_summaries(db, school, questions):
+    one = make_student(db, school, [questions])
+    many = make_student(db, school, [questions] * 6)
+    _, with_summary = results_statements(db, many)
+
+    drop_summaries(db, one)
+    drop_summaries(db, many)
+    one_count, _ = results_statements(db, one)
+    many_count, many_response = results_statements(db, many)
+
+    # Sınavlar + load_summaries
+    assert one_count == many_count == 2
+    # Tablolardan kurulan özet notlandırmada yazılanla aynı
+    assert many_response == with_summary
+
+
+def test_results_query_count_independent_of_questions_per_exam(db, school):
+    small = make_questions(db, 5)
+    large = make_questions(db, 40)
+    few = make_student(db, school, [small, small])
+    many = make_student(db, school, [large, small, large])
+
+    few_count, few_response = results_statements(db, few)
+    many_count, many_response = results_statements(db, many)
+    assert [len(e.answers) for e in few_response.exams] == [5, 5]
+    assert sorted(len(e.answers) for e in many_response.exams) == [5, 40, 40]
+    assert few_count == many_count == 1
+
+    drop_summaries(db, few)
+    drop_summaries(db, many)
+    few_count, _ = results_statements(db, few)
+    many_count, without_summary = results_statements(db, many)
+    assert few_count == many_count == 2
+    assert without_summary == many_response
@@ -0,0 +1,48 @@
+# tools/answer_key.py
+
+from collections import namedtuple
+
+# Bir sorunun değerlendirme için derlenmiş hali. Şık metinleri bir kere normalize edilir,
+# böylece notlandırma sırasında ne DB okuması ne de tekrar strip().lower() gerekir.
+#   correct_texts  : doğru şıkların normalize metinleri (single / multiple / true_false)
+#   positions      : (normalize metin, correct_position) çiftleri (ordering)
+#   choice_by_text : normalize metin -> ilk eşleşen şık id'si (user_choices eşleştirmesi)
+#   choice_by_id   : şık id'si -> şık kaydı
+#   norm_by_id     : şık id'si -> normalize metin (choice_id ile gönderilen cevaplar için)
+AnswerKey = namedtuple(
+    "AnswerKey",
+    ["question_id", "type", "points", "correct_texts", "positions", "choice_by_text", "choice_by_id", "norm_by_id"]
+)
+
+
+def normalize(text: str) -> str:
+    return text.strip().lower()
+
+
+def compile_answer_key(question) -> AnswerKey:
+    correct_texts = set()
+    positions = []
+    choice_by_text = {}
+    choice_by_id = {}
+    norm_by_id = {}
+    for c in question.question_choices:
+        norm = normalize(c.choice_text)
+        if c.is_correct:
+            correct_texts.add(norm)
+        if c.correct_position is not None:
+            positions.append((norm, c.correct_position))
+        # Aynı metne sahip birden fazla şık varsa ilki geçerli (eski döngüdeki "break" gibi)
+        choice_by_text.setdefault(norm, c.id)
+        choice_by_id[c.id] = c
+        norm_by_id[c.id] = norm
+
+    return AnswerKey(
+        question_id=question.id,
+        type=question.type,
+        points=question.points,
+        correct_texts=frozenset(correct_texts),
+        positions=tuple(positions),
+        choice_by_text=choice_by_text,
+        choice_by_id=choice_by_id,
+        norm_by_id=norm_by_id
+    )
@@ -0,0 +1,118 @@
+# tools/batch_grader.py
+#
+# Bir sorunun çok sayıda gönderimini (kohort) tek seferde, NumPy ile notlandırır.
+# Kurallar evaluate_question / evaluate_normalized ile birebir aynıdır.
+#
+# Bir sorunun seçimleri iki matris olarak kodlanır; sütunlar sorunun ayrık (normalize)
+# şık metinleridir, satırlar öğrenciler:
+#   counts : (öğrenci, metin + 1) her metnin kaç kez seçildiği; son sütun hiçbir şıkla
+#            eşleşmeyen seçimler (bilinmeyen metin / id). Tek seçimli sorularda "tam bir seçim"
+#            kuralı tekrarlanan ve bilinmeyen seçimleri de saydığı için bit maskesi yerine sayaç.
+#   first  : (öğrenci, metin) metnin öğrenci listesinde ilk geçtiği index, yoksa -1.
+#            Ordering sorularında permütasyon dizisinin karşılığı; eksik / tekrarlı listelerde de doğru.
+#
+# Kullanım:
+#   batch = encode_selections(key, [["a"], ["b", "c"], ...])
+#   points, is_full = grade_batch(question, key, batch)
+
+from collections import namedtuple
+import numpy as np
+from tools.answer_key import normalize
+
+ABSENT = -1
+
+BatchSelections = namedtuple("BatchSelections", ["texts", "counts", "first"])
+
+
+def text_columns(key):
+    """Sorunun ayrık normalize şık metinleri (şık sırasıyla); matris sütunlarının sırası."""
+    return tuple(dict.fromkeys(key.norm_by_id.values()))
+
+
+def encode_selections(key, selections) -> BatchSelections:
+    """
+    selections: her öğrenci için normalize seçim listesi (sırası korunur, None = eşleşmeyen).
+    Döngü yalnızca metinleri sütun index'ine çevirir; matrisler tek seferde doldurulur.
+    """
+    texts = text_columns(key)
+    column = {t: i for i, t in enumerate(texts)}
+    unknown = len(texts)
+
+    lengths = np.fromiter((len(s) for s in selections), dtype=np.int64, count=len(selections))
+    rows = np.repeat(np.arange(len(selections)), lengths)
+    cols = np.fromiter(
+        (column.get(t, unknown) for s in selections for t in s), dtype=np.int64, count=int(lengths.sum())
+    )
+    # Her seçimin kendi listesindeki index'i
+    starts = np.cumsum(lengths) - lengths
+    positions = np.arange(len(cols)) - np.repeat(starts, lengths)
+
+    counts = np.zeros((len(selections), len(texts) + 1), dtype=np.int64)
+    np.add.at(counts, (rows, cols), 1)
+
+    # İlk geçiş: hücre başına en küçük index
+    never = np.iinfo(np.int64).max
+    first = np.full((len(selections), len(texts) + 1), never, dtype=np.int64)
+    np.minimum.at(first, (rows, cols), positions)
+    first[first == never] = ABSENT
+    return BatchSelections(texts=texts, counts=counts, first=first[:, :unknown])
+
+
+def encode_texts(key, selected_texts) -> BatchSelections:
+    """Ham (normalize edilmemiş) metin listelerinden; evaluate_question girdisinin karşılığı."""
+    return encode_selections(key, [[normalize(t) for t in s] for s in selected_texts])
+
+
+def encode_choice_ids(key, choice_ids) -> BatchSelections:
+    """Şık id listelerinden; evaluate_choice_ids girdisinin karşılığı."""
+    return encode_selections(key, [[key.norm_by_id.get(cid) for cid in s] for s in choice_ids])
+
+
+def grade_batch(question, key, batch: BatchSelections):
+    """(points, is_full) dizileri; i. eleman i. öğrencinin evaluate_normalized sonucu."""
+    counts = batch.counts
+    students = counts.shape[0]
+    correct = np.array([t in key.correct_texts for t in batch.texts] + [False], dtype=bool)
+    zero = (np.zeros(students, dtype=np.int64), np.zeros(students, dtype=bool))
+
+    if question.type in ("true_false", "single_choice"):
+        if not key.correct_texts:
+            return zero
+        # Tam olarak bir seçim ve o seçim doğru şıklardan biri
+        full = (counts.sum(axis=1) == 1) & (counts[:, correct].sum(axis=1) == 1)
+        return np.where(full, question.points, 0).astype(np.int64), full
+
+    elif question.type == "multiple_choice":
+        total_correct = len(key.correct_texts)
+        if total_correct == 0:
+            return zero
+        # Yanlış (veya eşleşmeyen) şık seçilmişse 0
+        subset = counts[:, ~correct].sum(axis=1) == 0
+        correct_selected = (counts[:, correct] > 0).sum(axis=1)
+        # int(points * (a / b)) ile aynı float64 işlemleri, sonra sıfıra doğru kesme
+        partial = np.trunc(question.points * (correct_selected / total_correct)).astype(np.int64)
+        points = np.where(subset, partial, 0)
+        return points, subset & (points == question.points)
+
+    elif question.type == "ordering":
+        column = {t: i for i, t in enumerate(batch.texts)}
+        full = np.ones(students, dtype=bool)
+        for normalized_choice, correct_position in key.positions:
+            pos = batch.first[:, column[normalized_choice]]
+            full &= (pos == correct_position) & (pos != ABSENT)
+        return np.where(full, question.points, 0).astype(np.int64), full
+
+    return zero
+
+
+def grade_cohort(questions, keys, batches):
+    """
+    Bir kohortun tüm soruları: batches[j] j. sorunun seçimleri (aynı öğrenci sırasıyla).
+    (öğrenci, soru) boyutunda puan ve tam-doğru matrisleri döner.
+    """
+    graded = [grade_batch(q, k, b) for q, k, b in zip(questions, keys, batches)]
+    if not graded:
+        return np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0), dtype=bool)
+    points = np.stack([p for p, _ in graded], axis=1)
+    is_full = np.stack([f for _, f in graded], axis=1)
+    return points, is_full
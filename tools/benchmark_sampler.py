@@ -0,0 +1,106 @@
+# tools/benchmark_sampler.py
+#
+# Sınav soru seçimi için örnekleme yollarını karşılaştırır:
+#   full_scan     : load_questions + section başına random.sample (eski /exams/start yolu)
+#   order_random  : section başına ORDER BY random() LIMIT 5 (legacy take_exam)
+#   index_sampler : sample_question_ids (tek sorgu, (section, random_key) index'i)
+#
+# Kullanım (uygulamanın .env ayarlarıyla aynı veritabanına bağlanır):
+#   python -m tools.benchmark_sampler --sizes 1000 100000 1000000
+#
+# Ölçümler ayrı bir şemada (varsayılan "sampler_bench") yapılır, gerçek tablolara dokunulmaz.
+
+import argparse
+import random
+import statistics
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from tools.database import Base, DATABASE_URL
+from tools.models import Question
+from tools.exam import load_questions, sample_question_ids, QUESTIONS_PER_SECTION
+
+SECTIONS = (1, 2, 3, 4)
+
+
+def fill_questions(session, size):
+    session.execute(text("TRUNCATE questions CASCADE"))
+    session.execute(text("""
+        INSERT INTO questions (id, external_id, section, question, points, type)
+        SELECT gen_random_uuid(), 'bench-' || g, 1 + g % 4, 'Benchmark question ' || g, 5, 'true_false'
+        FROM generate_series(1, :size) AS g
+    """), {"size": size})
+    session.commit()
+    session.execute(text("ANALYZE questions"))
+    session.commit()
+
+
+def full_scan(session):
+    questions = load_questions(session)
+    for sec in SECTIONS:
+        sec_qs = [q for q in questions if q.section == sec]
+        random.sample(sec_qs, QUESTIONS_PER_SECTION)
+    session.expunge_all()
+
+
+def order_random(session):
+    for sec in SECTIONS:
+        session.query(Question.id).filter(Question.section == sec).order_by(
+            text("random()")
+        ).limit(QUESTIONS_PER_SECTION).all()
+
+
+def index_sampler(session):
+    sample_question_ids(session)
+
+
+def measure(func, session, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(session)
+        timings.append((time.perf_counter() - start) * 1000)
+        session.rollback()
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark exam question samplers.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions for the SQL samplers")
+    parser.add_argument("--scan-repeat", type=int, default=3, help="repetitions for the full scan")
+    parser.add_argument("--schema", default="sampler_bench")
+    args = parser.parse_args()
+
+    admin_engine = create_engine(DATABASE_URL, future=True)
+    with admin_engine.begin() as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+        conn.execute(text(f'CREATE SCHEMA "{args.schema}"'))
+
+    engine = create_engine(
+        DATABASE_URL, future=True,
+        connect_args={"options": f"-csearch_path={args.schema}"}
+    )
+    try:
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        print(f"{'questions':>10} | {'full_scan':>12} | {'order_random':>12} | {'index_sampler':>13}")
+        print("-" * 58)
+        with Session() as session:
+            for size in args.sizes:
+                fill_questions(session, size)
+                scan_ms = measure(full_scan, session, args.scan_repeat)
+                order_ms = measure(order_random, session, args.repeat)
+                sampler_ms = measure(index_sampler, session, args.repeat)
+                print(f"{size:>10} | {scan_ms:>9.2f} ms | {order_ms:>9.2f} ms | {sampler_ms:>10.2f} ms")
+    finally:
+        engine.dispose()
+        with admin_engine.begin() as conn:
+            conn.execute(text(f'DROP SCHEMA IF EXISTS "{args.schema}" CASCADE'))
+        admin_engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# tools/class_results.py
+#
+# Öğretmenin sınıf sonuçları: sınıftaki her öğrencinin her sınavı için öğretmenin
+# section'ındaki doğru / yanlış sayısı ve puanı. Bir sayfa tek bir gruplu SQL ile okunur;
+# toplam öğrenci sayısı da aynı sorgudan (count(*) OVER ()) gelir.
+# Sınav günü sayfa sürekli yenilendiği için sonuçlar kısa bir süre process içinde saklanır.
+
+import os
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Sayfa sonucunun saklanma süresi (saniye)
+CLASS_RESULTS_TTL = int(os.getenv("CLASS_RESULTS_TTL", "15"))
+# Saklanan en fazla sayfa sayısı
+CLASS_RESULTS_CACHE_SIZE = int(os.getenv("CLASS_RESULTS_CACHE_SIZE", "1000"))
+
+# Önce sayfadaki öğrenciler seçilir, sonra yalnızca onların kapanmış sınavları
+# (sınav, section) bazında toplanır. Öğrencisi olmayan sınavlar / sınavı olmayan
+# öğrenciler LEFT JOIN ile korunur.
+CLASS_RESULTS_SQL = """
+    WITH students AS (
+        SELECT u.user_id, u.username, u.name, u.surname, u.score_avg, count(*) OVER () AS total
+        FROM users u
+        WHERE u.school_id = :school_id AND u.class_name = :class_name AND u.role = 'student'
+        ORDER BY u.surname, u.name, u.user_id
+        LIMIT :limit OFFSET :offset
+    ),
+    exam_scores AS (
+        SELECT e.user_id, e.exam_id, e.end_time,
+               row_number() OVER (PARTITION BY e.user_id ORDER BY e.end_time, e.exam_id) AS attempt,
+               count(*) FILTER (WHERE ea.points_earned = q.points) AS correct,
+               count(*) FILTER (WHERE ea.points_earned IS DISTINCT FROM q.points) AS wrong,
+               coalesce(sum(ea.points_earned) FILTER (WHERE ea.points_earned = q.points), 0) AS score
+        FROM students s
+        JOIN exams e ON e.user_id = s.user_id AND e.end_time IS NOT NULL
+        JOIN exam_answers ea ON ea.exam_id = e.exam_id
+        JOIN questions q ON q.id = ea.question_id AND q.section = :section
+        GROUP BY e.user_id, e.exam_id, e.end_time
+    )
+    SELECT s.user_id, s.username, s.name, s.surname, s.score_avg, s.total,
+           x.exam_id, x.attempt, x.end_time, x.correct, x.wrong, x.score
+    FROM students s
+    LEFT JOIN exam_scores x ON x.user_id = s.user_id
+    ORDER BY s.surname, s.name, s.user_id, x.attempt
+"""
+
+CLASS_SIZE_SQL = """
+    SELECT count(*) FROM users
+    WHERE school_id = :school_id AND class_name = :class_name AND role = 'student'
+"""
+
+ExamSectionResult = namedtuple("ExamSectionResult", ["exam_id", "attempt", "end_time", "correct", "wrong", "score"])
+StudentResult = namedtuple("StudentResult", ["user_id", "username", "full_name", "score_avg", "exams"])
+ClassResultsPage = namedtuple("ClassResultsPage", ["total", "students"])
+
+
+def class_results(db: Session, school_id, class_name, section: int, page: int, page_size: int) -> ClassResultsPage:
+    rows = db.execute(text(CLASS_RESULTS_SQL), {
+        "school_id": school_id,
+        "class_name": class_name,
+        "section": section,
+        "limit": page_size,
+        "offset": (page - 1) * page_size
+    }).all()
+
+    students = OrderedDict()
+    total = rows[0].total if rows else None
+    for r in rows:
+        student = students.get(r.user_id)
+        if student is None:
+            student = students[r.user_id] = StudentResult(
+                user_id=r.user_id,
+                username=r.username,
+                full_name=f"{r.name} {r.surname}",
+                score_avg=r.score_avg,
+                exams=[]
+            )
+        if r.exam_id is not None:
+            student.exams.append(ExamSectionResult(r.exam_id, r.attempt, r.end_time, r.correct, r.wrong, r.score))
+
+    if total is None:
+        # Son sayfanın ötesi: toplam yalnızca sayılarak bulunabilir
+        total = db.execute(text(CLASS_SIZE_SQL), {"school_id": school_id, "class_name": class_name}).scalar()
+    return ClassResultsPage(total=total, students=list(students.values()))
+
+
+class ClassResultsCache:
+    """(okul, sınıf, section, sayfa, sayfa boyu) -> ClassResultsPage, CLASS_RESULTS_TTL saniye."""
+
+    def __init__(self, ttl: int = CLASS_RESULTS_TTL, max_size: int = CLASS_RESULTS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, school_id, class_name, section: int, page: int, page_size: int) -> ClassResultsPage:
+        key = (str(school_id), class_name, section, page, page_size)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        result = class_results(db, school_id, class_name, section, page, page_size)
+        if self.ttl > 0 and self.max_size > 0:
+            with self._lock:
+                self._pages[key] = (now, result)
+                self._pages.move_to_end(key)
+                while len(self._pages) > self.max_size:
+                    self._pages.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+# Uygulama genelinde paylaşılan tek instance
+class_results_cache = ClassResultsCache()
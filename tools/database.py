@@ -3,7 +3,7 @@ import os
 import sys
 import time
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
@@ -38,6 +38,51 @@ else:
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# create_all mevcut tablolara yeni kolon/index eklemez.
+# Sonradan modele eklenen alanlar burada idempotent şekilde uygulanır.
+SCHEMA_UPGRADES = [
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS random_key DOUBLE PRECISION NOT NULL DEFAULT random()",
+    "CREATE INDEX IF NOT EXISTS ix_questions_section_random_key ON questions (section, random_key)",
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS seq BIGINT GENERATED BY DEFAULT AS IDENTITY",
+    "ALTER TABLE exams ADD COLUMN IF NOT EXISTS question_seqs BIGINT[]",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_questions_seq ON questions (seq)",
+    "ALTER TABLE exams ADD COLUMN IF NOT EXISTS summary JSONB",
+    "CREATE INDEX IF NOT EXISTS ix_exams_user_id_end_time ON exams (user_id, end_time)",
+    "CREATE INDEX IF NOT EXISTS ix_exams_school_id_end_time ON exams (school_id, end_time)",
+    "CREATE INDEX IF NOT EXISTS ix_exam_answers_exam_id ON exam_answers (exam_id)",
+    "CREATE INDEX IF NOT EXISTS ix_exam_answers_question_id_id ON exam_answers (question_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_user_choices_exam_answer_id ON user_choices (exam_answer_id)",
+    "ALTER TABLE statistics ADD COLUMN IF NOT EXISTS score_sum DOUBLE PRECISION NOT NULL DEFAULT 0",
+    "ALTER TABLE statistics ADD COLUMN IF NOT EXISTS exam_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE statistics ADD COLUMN IF NOT EXISTS shard INTEGER NOT NULL DEFAULT 0",
+    # Eski satırlarda sadece ortalama var; tek sınavlık toplam olarak kabul et
+    """UPDATE statistics SET score_sum = average_score, exam_count = 1
+       WHERE exam_count = 0 AND correct_questions + wrong_questions > 0""",
+    # Eşzamanlı submit'lerin oluşturduğu mükerrer satırları birleştir (unique index öncesi)
+    """UPDATE statistics s
+       SET correct_questions = m.c, wrong_questions = m.w, score_sum = m.ss, exam_count = m.ec
+       FROM (SELECT school_id, class_name, section_number, shard, min(id::text) AS keep_id,
+                    sum(correct_questions) AS c, sum(wrong_questions) AS w,
+                    sum(score_sum) AS ss, sum(exam_count) AS ec
+             FROM statistics GROUP BY school_id, class_name, section_number, shard
+             HAVING count(*) > 1) m
+       WHERE s.id::text = m.keep_id""",
+    """DELETE FROM statistics s
+       USING (SELECT school_id, class_name, section_number, shard, min(id::text) AS keep_id
+              FROM statistics GROUP BY school_id, class_name, section_number, shard
+              HAVING count(*) > 1) m
+       WHERE s.school_id = m.school_id AND s.class_name = m.class_name
+         AND s.section_number = m.section_number AND s.shard = m.shard
+         AND s.id::text <> m.keep_id""",
+    # Shard'sız eski unique kısıt, shard'lı olanla değiştirilir
+    "ALTER TABLE statistics DROP CONSTRAINT IF EXISTS uq_statistics_school_class_section",
+    """DO $$ BEGIN
+         ALTER TABLE statistics ADD CONSTRAINT uq_statistics_school_class_section_shard
+             UNIQUE (school_id, class_name, section_number, shard);
+       EXCEPTION WHEN duplicate_table OR duplicate_object THEN NULL;
+       END $$""",
+]
+
 def get_db():
     db = SessionLocal()
     try:
@@ -46,7 +91,10 @@ def get_db():
         db.close()
 
 def init_db():
-    from tools.models import User, Question, Exam, ExamAnswer, Statistics, School, QuestionChoice
+    from tools.models import (
+        User, Question, Exam, ExamAnswer, Statistics, StatisticsBucket, StatisticsHistogram, StatisticsRebuild,
+        School, QuestionChoice, RegradeJob, RegradeChunk
+    )
 
     from migrate_questions import main as migrate_questions_main
     from tools.user import create_admin_user
@@ -57,6 +105,8 @@ def init_db():
         Base.metadata.create_all(bind=engine)
         logger.info("All tables created successfully.")
 
+        upgrade_schema()
+
         # Seed initial data
         seed_initial_data()
 
@@ -72,6 +122,16 @@ def init_db():
         logger.error(f"Error during database initialization: {e}")
         sys.exit(1)
 
+def upgrade_schema(conn=None):
+    """SCHEMA_UPGRADES'i uygular; conn verilirse onun transaction'ında (commit çağırana kalır)."""
+    if conn is None:
+        with engine.begin() as conn:
+            upgrade_schema(conn)
+        return
+    for stmt in SCHEMA_UPGRADES:
+        conn.execute(text(stmt))
+    logger.info("Schema upgrades applied.")
+
 def seed_initial_data():
     from tools.models import School
     with next(get_db()) as db:
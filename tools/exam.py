@@ -1,52 +1,250 @@
 # tools/exam.py
+import os
 import random
 from datetime import datetime
-from sqlalchemy.orm import Session
+from uuid import uuid4
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session, selectinload
 from typing import Dict, List
-from tools.models import Question, QuestionChoice, Exam, ExamAnswer, UserChoice, User
+from tools.models import Question, Exam, ExamAnswer, UserChoice, User, exam_question_association
 from tools.statistics_utils import update_statistics
+from tools.stats_aggregator import stats_aggregator
+from tools.leaderboard import leaderboards
+from tools.results_cache import results_cache
+from tools.question_cache import question_bank, to_cached_question
+from tools.answer_key import normalize
+from tools.exam_summary import summary_answer, build_summary
+
+# "cache": soru bankası process belleğinde tutulur (varsayılan)
+# "sql":   her sınav için sorular DB'de index üzerinden örneklenir (çok büyük bankalar için)
+QUESTION_SAMPLER = os.getenv("QUESTION_SAMPLER", "cache")
+QUESTIONS_PER_SECTION = 5
+
+# Her section için "draws" adet rastgele pivot üretilir; her pivot,
+# (section, random_key) index'inde random_key >= pivot olan ilk soruyu seçer
+# (yoksa başa sarar). Maliyet banka büyüklüğünden bağımsız: pivot başına bir index araması.
+#
+# Bir sorunun seçilme olasılığı kendi random_key'inden önceki boşlukla orantılıdır; anahtarlar
+# sabit kalsaydı bu eğilim kalıcı olurdu (simülasyonda soruların %10'u çekilişlerin ~%33'ünü
+# alıyor, ~%10'u neredeyse hiç çıkmıyor). Bu yüzden seçilen sorulara aynı sorgudaki "rekeyed"
+# CTE'si ile yeni bir random_key verilir: büyük boşluğun arkasındaki soru çekildikçe yer
+# değiştirir ve uzun vadede her soru eşit sıklıkta seçilir (aynı simülasyonda en çok çıkan
+# soru ortalamanın ~1.6 katı).
+SECTION_SAMPLE_SQL = text("""
+    WITH pivots AS MATERIALIZED (
+        SELECT s.section, g.n AS pick, random() AS pivot
+        FROM unnest(CAST(:sections AS integer[])) AS s(section)
+        CROSS JOIN generate_series(1, :draws) AS g(n)
+    ),
+    drawn AS (
+        SELECT p.section, min(p.pick) AS pick, q.id
+        FROM pivots p
+        CROSS JOIN LATERAL (
+            (SELECT id FROM questions
+             WHERE section = p.section AND random_key >= p.pivot
+             ORDER BY random_key LIMIT 1)
+            UNION ALL
+            (SELECT id FROM questions
+             WHERE section = p.section
+             ORDER BY random_key LIMIT 1)
+            LIMIT 1
+        ) q
+        GROUP BY p.section, q.id
+    ),
+    picks AS (
+        SELECT section, pick, id
+        FROM (SELECT d.*, row_number() OVER (PARTITION BY section ORDER BY pick) AS rn FROM drawn d) d
+        WHERE rn <= :per_section
+    ),
+    rekeyed AS (
+        -- Başka bir start isteğinin kilitlediği satır beklenmeden atlanır. NO KEY UPDATE, düz bir
+        -- UPDATE'in aldığı kilittir; association / exam_answers INSERT'lerinin foreign key
+        -- kontrolündeki KEY SHARE kilidini bloklamaz.
+        UPDATE questions SET random_key = random()
+        WHERE id IN (
+            SELECT id FROM questions WHERE id IN (SELECT id FROM picks)
+            FOR NO KEY UPDATE SKIP LOCKED
+        )
+        RETURNING id
+    )
+    SELECT section, id FROM picks
+    ORDER BY section, pick
+""")
 
 def load_questions(db: Session):
     return db.query(Question).all()
 
-def select_questions(db: Session, user: User):
-    if user.attempts >= 2:
-        return None
-    questions = load_questions(db)
+def sample_question_ids(db: Session, per_section: int = QUESTIONS_PER_SECTION, sections=(1, 2, 3, 4)):
+    """
+    Her section'dan en fazla per_section adet farklı soru id'si döndürür: { section: [id, ...] }.
+    Örnekleme ve seçilen sorulara yeni random_key verilmesi tek sorguda çalışır; aynı soruya
+    düşen pivotlar için 3 kat fazla çekilir. Yeni anahtarlar çağıranın transaction'ıyla
+    (sınav kaydıyla birlikte) commit edilir.
+    Yalnızca çok küçük section'larda eksik kalırsa ikinci bir sorgu ile tamamlanır.
+    """
+    rows = db.execute(SECTION_SAMPLE_SQL, {
+        "sections": list(sections), "draws": per_section * 3, "per_section": per_section
+    }).all()
+
+    picked = {sec: [] for sec in sections}
+    for sec, qid in rows:
+        picked[sec].append(qid)
+
+    for sec, ids in picked.items():
+        if len(ids) < per_section:
+            # Küçük section: tamamını taramak zaten ucuz (random() sıralaması eğilimsiz, anahtar gerekmez)
+            rest = db.query(Question.id).filter(
+                Question.section == sec, Question.id.notin_(ids)
+            ).order_by(text("random()")).limit(per_section - len(ids)).all()
+            ids.extend(r.id for r in rest)
+    return picked
+
+def sample_sections(db: Session):
+    """Kullanıcıdan bağımsız olarak bir sınav kağıdı için soruları seçer."""
+    if QUESTION_SAMPLER == "sql":
+        return select_questions_sql(db)
 
     # basit random logic -> her section'dan 5 tane
+    # Sorular process seviyesindeki cache'ten gelir (CachedQuestion kayıtları)
     sections = {1: [], 2: [], 3: [], 4: []}
     for sec in range(1, 5):
-        sec_qs = [q for q in questions if q.section == sec]
-        selected = sec_qs if len(sec_qs) < 5 else random.sample(sec_qs, 5)
+        sec_qs = question_bank.section(db, sec)
+        selected = list(sec_qs) if len(sec_qs) < QUESTIONS_PER_SECTION else random.sample(sec_qs, QUESTIONS_PER_SECTION)
         sections[sec] = selected
     return sections
 
+def load_questions_by_ids(db: Session, ids):
+    """Verilen id'lerdeki soruları şıklarıyla birlikte (2 sorgu) CachedQuestion olarak döndürür."""
+    questions = db.query(Question).options(selectinload(Question.question_choices)).filter(
+        Question.id.in_(ids)
+    ).all()
+    return {q.id: to_cached_question(q) for q in questions}
+
+def load_questions_by_seqs(db: Session, seqs):
+    """Verilen seq'lerdeki soruları şıklarıyla birlikte (2 sorgu) CachedQuestion olarak döndürür."""
+    questions = db.query(Question).options(selectinload(Question.question_choices)).filter(
+        Question.seq.in_(seqs)
+    ).all()
+    return {q.seq: to_cached_question(q) for q in questions}
+
+def select_questions_sql(db: Session):
+    picked = sample_question_ids(db)
+    by_id = load_questions_by_ids(db, [qid for ids in picked.values() for qid in ids])
+    return {sec: [by_id[qid] for qid in ids if qid in by_id] for sec, ids in picked.items()}
+
+def exam_sections(db: Session, exam: Exam):
+    """
+    Başlatılmış bir sınavın kağıdını { section: [CachedQuestion, ...] } olarak döndürür.
+    Compact kağıtta question_seqs'ten (kağıt sırasıyla), diğerlerinde association'dan okunur.
+    """
+    if exam.question_seqs is not None:
+        by_seq = {}
+        if QUESTION_SAMPLER != "sql":
+            for seq in exam.question_seqs:
+                q = question_bank.get_by_seq(db, seq)
+                if q is not None:
+                    by_seq[seq] = q
+        missing = [seq for seq in exam.question_seqs if seq not in by_seq]
+        if missing:
+            by_seq.update(load_questions_by_seqs(db, missing))
+
+        sections = {1: [], 2: [], 3: [], 4: []}
+        for seq in exam.question_seqs:
+            q = by_seq.get(seq)
+            if q is not None:
+                sections.setdefault(q.section, []).append(q)
+        return sections
+
+    ids = [row.question_id for row in db.query(exam_question_association.c.question_id).filter(
+        exam_question_association.c.exam_id == exam.exam_id
+    ).all()]
+    by_id = {}
+    if QUESTION_SAMPLER != "sql":
+        for qid in ids:
+            q = question_bank.get(db, qid)
+            if q is not None:
+                by_id[qid] = q
+    missing = [qid for qid in ids if qid not in by_id]
+    if missing:
+        by_id.update(load_questions_by_ids(db, missing))
+
+    sections = {1: [], 2: [], 3: [], 4: []}
+    for q in sorted(by_id.values(), key=lambda q: q.seq):
+        sections.setdefault(q.section, []).append(q)
+    return sections
+
+def find_open_exam(db: Session, user: User):
+    """Kullanıcının henüz gönderilmemiş (end_time NULL) en son sınavı."""
+    return db.query(Exam).filter(
+        Exam.user_id == user.user_id,
+        Exam.end_time.is_(None)
+    ).order_by(Exam.start_time.desc()).first()
+
+def serialize_questions(selected_questions) -> str:
+    """
+    /exams/start cevabındaki "questions" kısmını JSON olarak döndürür:
+    { "section": [ {question_id, external_id, question, points, type, choices}, ... ] }
+    Her sorunun parçası cache'te hazır tutulur; burada sadece birleştiriyoruz.
+    """
+    parts = []
+    for sec, qs in selected_questions.items():
+        frags = ", ".join(question_bank.fragment(q) for q in qs)
+        parts.append(f'"{sec}": [{frags}]')
+    return "{" + ", ".join(parts) + "}"
+
 def process_results(db: Session, user: User, exam: Exam, selected_questions: List[Question], answers_dict, end_time):
-    # "answers_dict" => { question_id: { "selected_texts": [..] } }
+    # "answers_dict" => { question_id: { "choice_ids": [..] } } veya eski istemciler için
+    #                   { question_id: { "selected_texts": [..] } }
+    #
+    # Önce tüm gönderim bellekte değerlendirilir, sonra cevaplar, seçimler,
+    # kullanıcı puanı, sınav kapanışı ve istatistikler TEK transaction'da yazılır:
+    # exam_answers ve user_choices için birer çok satırlı INSERT.
 
     section_correct = {1: 0, 2: 0, 3: 0, 4: 0}
     section_wrong = {1: 0, 2: 0, 3: 0, 4: 0}
     section_scores = {1: 0, 2: 0, 3: 0, 4: 0}
 
+    answer_rows = []
+    choice_rows = []
+    summary_answers = []
+
     for q in selected_questions:
+        exam_answer_id = uuid4()
         ans_data = answers_dict.get(str(q.id))
         if not ans_data:
             # User hiç cevap vermemiş
-            create_exam_answer(db, exam, q, 0, [])  # 0 puan
+            answer_rows.append(exam_answer_row(exam, q, exam_answer_id, 0))  # 0 puan
+            summary_answers.append(summary_answer(q, 0, []))
             section_wrong[q.section] += 1
             continue
 
-        selected_texts = ans_data.selected_texts or []
-        # "selected_texts" -> list[str], ordering / multiple / single / tf
+        key = question_bank.answer_key(q)
+        if ans_data.choice_ids:
+            # choice_id ile gelen cevap: O(1) sözlük araması, metin eşleştirmesi yok
+            choice_ids = ans_data.choice_ids
+            points_earned, is_correct = evaluate_choice_ids(q, choice_ids, key)
+            answer_rows.append(exam_answer_row(exam, q, exam_answer_id, points_earned))
+            rows = user_choice_rows_by_id(q, exam_answer_id, choice_ids, key)
+        else:
+            selected_texts = ans_data.selected_texts or []
+            # "selected_texts" -> list[str], ordering / multiple / single / tf
+            if q.type == "ordering":
+                # UI sıralamayı tek metin ("A, B, C") olarak gönderir; saklanan satırlarla
+                # (ve yeniden notlandırmayla) aynı liste notlansın
+                selected_texts = split_ordering_texts(selected_texts)
 
-        # 1) ExamAnswer kaydı
-        exam_ans = create_exam_answer(db, exam, q, 0, selected_texts)
+            # 1) Doğruluk kontrolü (derlenmiş cevap anahtarı ile, DB okuması yok)
+            points_earned, is_correct = evaluate_question(q, selected_texts, key)
 
-        # 2) Doğruluk kontrolü
-        points_earned, is_correct = evaluate_question(db, q, selected_texts)
-        exam_ans.points_earned = points_earned
-        db.commit()
+            # 2) ExamAnswer + UserChoice satırları
+            answer_rows.append(exam_answer_row(exam, q, exam_answer_id, points_earned))
+            rows = user_choice_rows(q, exam_answer_id, selected_texts, key)
+
+        choice_rows.extend(rows)
+        # Sonuç özeti: saklanan seçimlerin şık metinleri (sonuç sayfasının gösterdiğiyle aynı)
+        summary_answers.append(summary_answer(
+            q, points_earned, [key.choice_by_id[r["question_choice_id"]].choice_text for r in rows]
+        ))
 
         if is_correct:
             section_correct[q.section] += 1
@@ -54,6 +252,11 @@ def process_results(db: Session, user: User, exam: Exam, selected_questions: Lis
         else:
             section_wrong[q.section] += 1
 
+    if answer_rows:
+        db.execute(insert(ExamAnswer).values(answer_rows))
+    if choice_rows:
+        db.execute(insert(UserChoice).values(choice_rows))
+
     # Kullanıcının attempt/panel vs.
     user.attempts += 1
     user.last_attempt_date = datetime.now()
@@ -68,94 +271,127 @@ def process_results(db: Session, user: User, exam: Exam, selected_questions: Lis
         user.score_avg = (user.score1 + user.score2) / 2
 
     exam.end_time = end_time
+    exam.summary = build_summary(summary_answers)
+
+    # İstatistik: write-behind açıksa commit'ten SONRA toplayıcıya bırakılır
+    # (geri alınan bir gönderim istatistiğe girmesin), değilse aynı transaction'da yazılır.
+    school_id, class_name = user.school_id, user.class_name
+    user_id, username, score_avg = user.user_id, user.username, user.score_avg
+    full_name = f"{user.name} {user.surname}"
+    write_behind = stats_aggregator.running
+    if not write_behind:
+        update_statistics(db, school_id, class_name, section_correct, section_wrong, section_scores, end_time)
+
     db.commit()
 
-    # İstatistik
-    update_statistics(db, user.school_id, user.class_name, section_correct, section_wrong, section_scores)
+    if write_behind:
+        stats_aggregator.add(school_id, class_name, section_correct, section_wrong, section_scores, end_time)
 
+    # Öğrencinin önbellekteki sonuç sayfası artık eski
+    results_cache.invalidate(user_id)
 
-def create_exam_answer(db: Session, exam: Exam, question: Question, points_earned: int, selected_texts: List[str]):
-    exam_ans = ExamAnswer(
-        exam_id=exam.exam_id,
-        question_id=question.id,
-        points_earned=points_earned
-    )
-    db.add(exam_ans)
-    db.commit()
-    db.refresh(exam_ans)
+    # Sınıf sıralamasında öğrencinin yerini güncelle (commit'ten sonra)
+    leaderboards.update(school_id, class_name, user_id, username, full_name, score_avg)
+
+
+def exam_answer_row(exam: Exam, question: Question, exam_answer_id, points_earned: int):
+    return {
+        "id": exam_answer_id,
+        "exam_id": exam.exam_id,
+        "question_id": question.id,
+        "points_earned": points_earned
+    }
+
+
+def split_ordering_texts(selected_texts: List[str]) -> List[str]:
+    """Ordering cevabı tek virgüllü metin olarak geldiyse ("A, B, C") elemanlarına ayırır."""
+    if len(selected_texts) == 1 and "," in selected_texts[0]:
+        return [x.strip() for x in selected_texts[0].split(",")]
+    return selected_texts
+
+
+def user_choice_rows(question: Question, exam_answer_id, selected_texts: List[str], key=None):
+    """Kullanıcının seçtiği metinleri sorunun şıklarıyla eşleştirip user_choices satırlarını üretir."""
+    if key is None:
+        key = question_bank.answer_key(question)
+    rows = []
 
-    # Tüm seçenekleri bir kere çek
-    all_choices = db.query(QuestionChoice).filter(QuestionChoice.question_id == question.id).all()
-    
     if question.type == "ordering":
-        if len(selected_texts) == 1 and "," in selected_texts[0]:
-            splitted = [x.strip() for x in selected_texts[0].split(",")]
-        else:
-            splitted = selected_texts
-
-        for idx, val in enumerate(splitted):
-            normalized_val = val.strip().lower()
-            # Tüm seçeneklerde normalize ederek ara
-            for choice in all_choices:
-                if choice.choice_text.strip().lower() == normalized_val:
-                    uc = UserChoice(
-                        exam_answer_id=exam_ans.id,
-                        question_choice_id=choice.id,
-                        user_position=idx
-                    )
-                    db.add(uc)
-                    db.commit()
-                    break
+        for idx, val in enumerate(split_ordering_texts(selected_texts)):
+            choice_id = key.choice_by_text.get(normalize(val))
+            if choice_id is not None:
+                rows.append({
+                    "id": uuid4(),
+                    "exam_answer_id": exam_answer_id,
+                    "question_choice_id": choice_id,
+                    "user_position": idx
+                })
 
     elif question.type in ["single_choice", "multiple_choice", "true_false"]:
         for txt in selected_texts:
-            normalized_txt = txt.strip().lower()
-            # Tüm seçeneklerde normalize ederek ara
-            for choice in all_choices:
-                if choice.choice_text.strip().lower() == normalized_txt:
-                    uc = UserChoice(
-                        exam_answer_id=exam_ans.id,
-                        question_choice_id=choice.id
-                    )
-                    db.add(uc)
-                    db.commit()
-                    break
-    
-    return exam_ans
-
-
-def evaluate_question(db: Session, question: Question, selected_texts: List[str]):
+            choice_id = key.choice_by_text.get(normalize(txt))
+            if choice_id is not None:
+                rows.append({
+                    "id": uuid4(),
+                    "exam_answer_id": exam_answer_id,
+                    "question_choice_id": choice_id,
+                    "user_position": None
+                })
+
+    return rows
+
+
+def user_choice_rows_by_id(question: Question, exam_answer_id, choice_ids, key=None):
+    """choice_id listesinden user_choices satırları; soruya ait olmayan id'ler atlanır."""
+    if key is None:
+        key = question_bank.answer_key(question)
+    ordering = question.type == "ordering"
+    rows = []
+    for idx, choice_id in enumerate(choice_ids):
+        if choice_id in key.choice_by_id:
+            rows.append({
+                "id": uuid4(),
+                "exam_answer_id": exam_answer_id,
+                "question_choice_id": choice_id,
+                "user_position": idx if ordering else None
+            })
+    return rows
+
+
+def evaluate_question(question: Question, selected_texts: List[str], key=None):
     """
     Sorunun tipine göre user'ın seçimini doğru/yanlış değerlendirip puan döndürüyoruz.
+    Doğru cevaplar sorunun derlenmiş cevap anahtarından (AnswerKey) okunur.
     """
+    return evaluate_normalized(question, [normalize(txt) for txt in selected_texts], key)
+
+
+def evaluate_choice_ids(question: Question, choice_ids, key=None):
+    """evaluate_question ile aynı kurallar; cevaplar şık id'si olarak gelir."""
+    if key is None:
+        key = question_bank.answer_key(question)
+    # Bilinmeyen id -> None, hiçbir şıkla eşleşmez (yanlış şık gibi değerlendirilir)
+    return evaluate_normalized(question, [key.norm_by_id.get(cid) for cid in choice_ids], key)
+
+
+def evaluate_normalized(question: Question, selected, key=None):
+    """selected: kullanıcının normalize edilmiş seçimleri (sırası korunur)."""
     # max alabileceği puan = question.points
     # Bu basit örnekte, "tam doğruysa full puan, aksi 0" diyelim.
+    if key is None:
+        key = question_bank.answer_key(question)
 
-    if question.type == "true_false":
+    if question.type in ("true_false", "single_choice"):
         # Tek bir choice doğru, user da tek bir choice seçmişse -> check
-        correct_choice = db.query(QuestionChoice).filter_by(question_id=question.id, is_correct=True).first()
-        if not correct_choice:
+        if not key.correct_texts:
             return (0, False)
-        if len(selected_texts) == 1 and selected_texts[0] == correct_choice.choice_text:
-            return (question.points, True)
-        return (0, False)
-
-    elif question.type == "single_choice":
-        # Tek bir choice doğru
-        correct_choice = db.query(QuestionChoice).filter_by(question_id=question.id, is_correct=True).first()
-        if not correct_choice:
-            return (0, False)
-        if len(selected_texts) == 1 and selected_texts[0] == correct_choice.choice_text:
+        if len(selected) == 1 and selected[0] in key.correct_texts:
             return (question.points, True)
         return (0, False)
 
     elif question.type == "multiple_choice":
-        correct_choices = db.query(QuestionChoice).filter_by(
-            question_id=question.id, 
-            is_correct=True
-        ).all()
-        correct_texts = set(c.choice_text.strip().lower() for c in correct_choices)
-        user_set = set(txt.strip().lower() for txt in selected_texts)
+        correct_texts = key.correct_texts
+        user_set = set(selected)
 
         # Yanlış şık seçilirse direkt 0
         if not user_set.issubset(correct_texts):
@@ -174,30 +410,15 @@ def evaluate_question(db: Session, question: Question, selected_texts: List[str]
         return (partial_score, is_full)
 
     elif question.type == "ordering":
-        all_choices = db.query(QuestionChoice).filter_by(question_id=question.id).all()
-        mismatch = False
-        
-        # Kullanıcı girdilerini normalize et
-        normalized_selected = [x.strip().lower() for x in selected_texts]
-        
-        for c in all_choices:
-            if c.correct_position is None:
-                continue
-            # choice_text'i normalize et
-            normalized_choice = c.choice_text.strip().lower()
-            try:
-                user_index = normalized_selected.index(normalized_choice)
-                if user_index != c.correct_position:
-                    mismatch = True
-                    break
-            except ValueError:
-                mismatch = True
-                break
-
-        if mismatch:
-            return (0, False)
-        else:
-            return (question.points, True)
+        # Her (normalize) metnin kullanıcı listesinde ilk geçtiği index
+        first_index = {}
+        for idx, x in enumerate(selected):
+            first_index.setdefault(x, idx)
+
+        for normalized_choice, correct_position in key.positions:
+            if first_index.get(normalized_choice) != correct_position:
+                return (0, False)
+        return (question.points, True)
 
     # default
     return (0, False)
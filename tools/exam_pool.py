@@ -0,0 +1,139 @@
+# tools/exam_pool.py
+
+import os
+import logging
+import threading
+from collections import deque, namedtuple
+from tools.database import SessionLocal
+from tools.exam import sample_sections, serialize_questions
+from tools.question_cache import question_bank
+
+logger = logging.getLogger(__name__)
+
+# Havuzda hazır bekleyecek sınav kağıdı sayısı (0 => havuz kapalı)
+EXAM_POOL_SIZE = int(os.getenv("EXAM_POOL_SIZE", "200"))
+# Her doldurma turunda en fazla kaç kağıt üretilecek
+EXAM_POOL_REFILL_BATCH = int(os.getenv("EXAM_POOL_REFILL_BATCH", "50"))
+# Doldurma turları arasındaki bekleme (saniye)
+EXAM_POOL_REFILL_INTERVAL = float(os.getenv("EXAM_POOL_REFILL_INTERVAL", "0.5"))
+
+# "1" ise sınavlar association satırları yerine seçilen soruların seq listesiyle saklanır
+EXAM_COMPACT_PAPERS = os.getenv("EXAM_COMPACT_PAPERS", "0") == "1"
+
+# Hazır sınav kağıdı: seçilen soru id'leri + JSON'a çevrilmiş "questions" kısmı.
+# question_seqs yalnızca compact kağıtlarda dolu.
+ExamPaper = namedtuple("ExamPaper", ["cache_version", "question_ids", "payload", "question_seqs"])
+
+
+def make_paper(selected_questions, compact=False) -> ExamPaper:
+    questions = [q for qs in selected_questions.values() for q in qs]
+    return ExamPaper(
+        cache_version=question_bank.version,
+        question_ids=[q.id for q in questions],
+        payload=serialize_questions(selected_questions),
+        question_seqs=[q.seq for q in questions] if compact else None
+    )
+
+
+def generate_paper(db, compact=None):
+    """Yeni bir kağıt üretir; bankada hiç soru yoksa None döner."""
+    if compact is None:
+        compact = EXAM_COMPACT_PAPERS
+    selected = sample_sections(db)
+    if not any(selected.values()):
+        return None
+    return make_paper(selected, compact)
+
+
+class ExamPaperPool:
+    """
+    Önceden üretilmiş sınav kağıtları havuzu.
+    Arka plandaki producer thread havuzu EXAM_POOL_SIZE'a kadar doldurur;
+    /exams/start yalnızca bir kağıt alıp öğrenciye bağlar.
+    """
+
+    def __init__(self, size=EXAM_POOL_SIZE, refill_batch=EXAM_POOL_REFILL_BATCH,
+                 refill_interval=EXAM_POOL_REFILL_INTERVAL):
+        self.size = size
+        self.refill_batch = refill_batch
+        self.refill_interval = refill_interval
+        self._papers = deque()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.produced = 0
+        self.claimed = 0
+        self.misses = 0
+        self.discarded = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._papers)
+
+    def start(self):
+        if self.size <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="exam-paper-pool", daemon=True)
+        self._thread.start()
+        logger.info(f"Exam paper pool started (size={self.size}, batch={self.refill_batch}, "
+                    f"interval={self.refill_interval}s).")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def claim(self):
+        """Havuzdan bir kağıt alır; havuz boşsa None döner (çağıran canlı örnekleme yapar)."""
+        while True:
+            try:
+                paper = self._papers.popleft()
+            except IndexError:
+                self.misses += 1
+                return None
+            # Soru bankası değiştiyse eski kağıtları kullanma
+            if paper.cache_version != question_bank.version:
+                self.discarded += 1
+                continue
+            self.claimed += 1
+            return paper
+
+    def refill(self):
+        missing = min(self.size - self.depth, self.refill_batch)
+        if missing <= 0:
+            return 0
+        with SessionLocal() as db:
+            for _ in range(missing):
+                paper = generate_paper(db)
+                # SQL örnekleyicide çekilen soruların yeni random_key'leri kalıcı olsun
+                db.commit()
+                if paper is None:
+                    break
+                self._papers.append(paper)
+                self.produced += 1
+        return missing
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refill()
+            except Exception as e:
+                logger.error(f"Exam paper pool refill failed: {e}")
+            self._stop.wait(self.refill_interval)
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "size": self.size,
+            "refill_batch": self.refill_batch,
+            "refill_interval": self.refill_interval,
+            "produced": self.produced,
+            "claimed": self.claimed,
+            "misses": self.misses,
+            "discarded": self.discarded,
+        }
+
+
+exam_pool = ExamPaperPool()
@@ -0,0 +1,136 @@
+# tools/exam_summary.py
+#
+# Sınav sonuç özeti (Exam.summary, JSONB). Sonuçlar process_results bittikten sonra
+# değişmediği için özet notlandırma transaction'ında bir kere yazılır; sonuç sayfası
+# normalize tablolara (exam_answers / user_choices / question_choices) inmeden okur.
+#
+#   {
+#     "answers":  [{"question_id", "external_id", "question", "section",
+#                   "chosen": [şık metinleri], "is_correct", "points_earned"}, ...],
+#     "sections": {"1": {"correct", "wrong", "score"}, ...}
+#   }
+#
+# Özeti olmayan (bu değişiklikten önce kapanmış) sınavlar için load_summaries aynı özeti
+# tablolardan kurar. Yeniden notlandırma (tools/regrade.py) etkilenen özetleri rebuild_summaries
+# ile yeniler.
+#
+# Eski sınavları doldurmak için:
+#   python -m tools.exam_summary [--batch-size 500]
+
+import argparse
+import time
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+from tools.models import Exam, ExamAnswer, Question, QuestionChoice, UserChoice
+from tools.question_cache import SECTIONS
+
+
+def summary_answer(question, points_earned: int, chosen_texts):
+    return {
+        "question_id": str(question.id),
+        "external_id": question.external_id,
+        "question": question.question,
+        "section": question.section,
+        "chosen": list(chosen_texts),
+        # "tam puan = doğru" (sonuç sayfasının her zamanki tanımı)
+        "is_correct": points_earned == question.points,
+        "points_earned": points_earned
+    }
+
+
+def build_summary(answers):
+    """summary_answer kayıtlarından özet; cevaplar section, external_id sırasıyla."""
+    answers = sorted(answers, key=lambda a: (a["section"], a["external_id"]))
+    sections = {str(sec): {"correct": 0, "wrong": 0, "score": 0} for sec in SECTIONS}
+    for a in answers:
+        totals = sections.setdefault(str(a["section"]), {"correct": 0, "wrong": 0, "score": 0})
+        if a["is_correct"]:
+            totals["correct"] += 1
+            totals["score"] += a["points_earned"]
+        else:
+            totals["wrong"] += 1
+    return {"answers": answers, "sections": sections}
+
+
+def load_summaries(db: Session, exam_ids):
+    """
+    Verilen sınavların özetini normalize tablolardan kurar (tek sorgu).
+    Cevabı olmayan sınavlar boş özetle döner.
+    """
+    exam_ids = list(exam_ids)
+    if not exam_ids:
+        return {}
+    rows = db.query(
+        ExamAnswer.exam_id, ExamAnswer.id, ExamAnswer.points_earned,
+        Question.id, Question.external_id, Question.question, Question.section, Question.points,
+        QuestionChoice.choice_text
+    ).join(
+        Question, Question.id == ExamAnswer.question_id
+    ).outerjoin(
+        UserChoice, UserChoice.exam_answer_id == ExamAnswer.id
+    ).outerjoin(
+        QuestionChoice, QuestionChoice.id == UserChoice.question_choice_id
+    ).filter(
+        ExamAnswer.exam_id.in_(exam_ids)
+    ).order_by(
+        ExamAnswer.exam_id, ExamAnswer.id, UserChoice.user_position, UserChoice.id
+    ).all()
+
+    # exam_id -> {exam_answer_id: özet kaydı}
+    answers_by_exam = {exam_id: {} for exam_id in exam_ids}
+    for exam_id, answer_id, points_earned, question_id, external_id, question, section, points, choice_text in rows:
+        answers = answers_by_exam.setdefault(exam_id, {})
+        entry = answers.get(answer_id)
+        if entry is None:
+            entry = answers[answer_id] = {
+                "question_id": str(question_id),
+                "external_id": external_id,
+                "question": question,
+                "section": section,
+                "chosen": [],
+                "is_correct": points_earned == points,
+                "points_earned": points_earned
+            }
+        # Silinmiş şıklar atlanır
+        if choice_text is not None:
+            entry["chosen"].append(choice_text)
+
+    return {exam_id: build_summary(answers.values()) for exam_id, answers in answers_by_exam.items()}
+
+
+def rebuild_summaries(db: Session, exam_ids):
+    """Özetleri tablolardan yeniden kurup tek bir executemany UPDATE ile yazar (commit çağırana ait)."""
+    summaries = load_summaries(db, exam_ids)
+    if summaries:
+        stmt = text("UPDATE exams SET summary = :summary WHERE exam_id = :exam_id").bindparams(
+            bindparam("summary", type_=JSONB)
+        )
+        db.execute(stmt, [{"exam_id": exam_id, "summary": s} for exam_id, s in summaries.items()])
+    return len(summaries)
+
+
+def main():
+    from tools.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Fill Exam.summary for exams closed before summaries existed.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    done = 0
+    with SessionLocal() as db:
+        while True:
+            exam_ids = [r[0] for r in db.query(Exam.exam_id).filter(
+                Exam.end_time.isnot(None), Exam.summary.is_(None)
+            ).limit(args.batch_size)]
+            if not exam_ids:
+                break
+            done += rebuild_summaries(db, exam_ids)
+            db.commit()
+            print(f"  {done:,} exams summarized ({done / (time.perf_counter() - started):,.0f} exams/s)", flush=True)
+    print(f"Done: {done:,} exam summaries written in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
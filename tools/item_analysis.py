@@ -0,0 +1,189 @@
+# tools/item_analysis.py
+#
+# Soru kalitesi (madde analizi), tüm kapanmış sınavlar üzerinden toplu ve vektörel hesaplanır:
+#   p_value        : zorluk, soruyu tam puanla doğru yapanların oranı
+#   point_biserial : ayırt edicilik, soru doğru/yanlış (0/1) ile sınavın geri kalan puanı
+#                    (toplam - bu sorunun puanı) arasındaki korelasyon (düzeltilmiş point-biserial)
+#
+# Cevaplar binary COPY ile tek seferde okunur ve satır satır Python döngüsü yerine
+# doğrudan NumPy dizilerine (sınav indeksi, soru seq'i, puan) çevrilir. Sınav x soru matrisi
+# seyrek olduğu için yoğun matris kurulmaz; tüm toplamlar np.bincount ile alınır.
+#
+# Kullanım (komut satırı):
+#   python -m tools.item_analysis
+
+import io
+import os
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Analiz sonucunun cache süresi (saniye)
+ITEM_ANALYSIS_TTL = int(os.getenv("ITEM_ANALYSIS_TTL", "600"))
+
+# Kapanmış sınavların cevapları: sınav id'si, soru seq'i, kazanılan puan, soru puanı.
+# Binary COPY'de her satır sabit genişlikte olduğu için doğrudan NumPy dizisi olarak okunur.
+ANSWERS_COPY_SQL = """
+    COPY (
+        SELECT ea.exam_id, q.seq, coalesce(ea.points_earned, 0), q.points
+        FROM exam_answers ea
+        JOIN exams e ON e.exam_id = ea.exam_id
+        JOIN questions q ON q.id = ea.question_id
+        WHERE e.end_time IS NOT NULL
+    ) TO STDOUT WITH (FORMAT binary)
+"""
+
+# Binary COPY satır düzeni: alan sayısı, sonra her alan için (uzunluk, değer); big-endian
+ANSWER_ROW = np.dtype([
+    ("fields", ">i2"),
+    ("exam_len", ">i4"), ("exam_id", "V16"),
+    ("seq_len", ">i4"), ("seq", ">i8"),
+    ("earned_len", ">i4"), ("earned", ">i4"),
+    ("points_len", ">i4"), ("points", ">i4"),
+])
+# İmza (11) + flags (4) + header extension uzunluğu (4); sonda -1 (2 byte)
+COPY_HEADER_SIZE = 19
+COPY_TRAILER_SIZE = 2
+
+ItemStats = namedtuple(
+    "ItemStats", ["question_id", "external_id", "section", "type", "responses", "p_value", "point_biserial"]
+)
+
+
+def load_answer_arrays(db: Session):
+    """(exam_idx, question_seq, points_earned, points) dizilerini döner; exam_idx 0..sınav sayısı-1."""
+    buf = io.BytesIO()
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(ANSWERS_COPY_SQL, buf)
+    finally:
+        cursor.close()
+
+    data = buf.getbuffer()
+    count = (len(data) - COPY_HEADER_SIZE - COPY_TRAILER_SIZE) // ANSWER_ROW.itemsize
+    rows = np.frombuffer(data, dtype=ANSWER_ROW, offset=COPY_HEADER_SIZE, count=max(count, 0))
+    if len(rows) and (rows["fields"] != 4).any():
+        raise ValueError("Unexpected row layout in binary COPY output.")
+
+    # Sınav id'lerini 0..n-1 indekslerine çevir (sınav x soru seyrek matrisinin satırları)
+    _, exam_idx = np.unique(rows["exam_id"], return_inverse=True)
+    return (
+        exam_idx.astype(np.int64),
+        rows["seq"].astype(np.int64),
+        rows["earned"].astype(np.int64),
+        rows["points"].astype(np.int64),
+    )
+
+
+def item_statistics(exam_idx, question_seq, points_earned, points):
+    """
+    Vektörel madde analizi. Dönen diziler soru seq'i ile indekslenir:
+      responses, p_value, point_biserial (tanımsızsa NaN)
+    """
+    size = int(question_seq.max()) + 1 if len(question_seq) else 0
+    correct = (points_earned == points).astype(np.float64)
+    earned = points_earned.astype(np.float64)
+
+    # Sınav toplamı ve her cevap için "geri kalan" puan
+    exam_total = np.bincount(exam_idx, weights=earned)
+    rest = exam_total[exam_idx] - earned
+
+    n = np.bincount(question_seq, minlength=size).astype(np.float64)
+    sum_x = np.bincount(question_seq, weights=correct, minlength=size)  # x ikili: x^2 = x
+    sum_r = np.bincount(question_seq, weights=rest, minlength=size)
+    sum_rr = np.bincount(question_seq, weights=rest * rest, minlength=size)
+    sum_xr = np.bincount(question_seq, weights=correct * rest, minlength=size)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_value = sum_x / n
+        cov = n * sum_xr - sum_x * sum_r
+        var_x = n * sum_x - sum_x * sum_x
+        var_r = n * sum_rr - sum_r * sum_r
+        point_biserial = cov / np.sqrt(var_x * var_r)
+    # Varyans yoksa (herkes doğru / herkes yanlış) korelasyon tanımsız
+    point_biserial[(var_x <= 0) | (var_r <= 0)] = np.nan
+    return n.astype(np.int64), p_value, point_biserial
+
+
+def analyze(db: Session, arrays=None):
+    """Tüm soru bankası için ItemStats listesi (section, external_id sırasıyla)."""
+    exam_idx, question_seq, points_earned, points = arrays if arrays is not None else load_answer_arrays(db)
+    responses, p_value, point_biserial = item_statistics(exam_idx, question_seq, points_earned, points)
+
+    results = []
+    rows = db.execute(text(
+        "SELECT seq, id, external_id, section, type FROM questions ORDER BY section, external_id"
+    )).all()
+    for seq, question_id, external_id, section, q_type in rows:
+        answered = seq < len(responses) and responses[seq] > 0
+        results.append(ItemStats(
+            question_id=question_id,
+            external_id=external_id,
+            section=section,
+            type=q_type,
+            responses=int(responses[seq]) if answered else 0,
+            p_value=float(p_value[seq]) if answered else None,
+            point_biserial=float(point_biserial[seq])
+            if answered and not np.isnan(point_biserial[seq]) else None
+        ))
+    return results
+
+
+class ItemAnalysisCache:
+    """Analiz pahalı; sonuç ITEM_ANALYSIS_TTL saniye boyunca process içinde saklanır."""
+
+    def __init__(self, ttl: int = ITEM_ANALYSIS_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._results = None
+        self._computed_at = None
+        self.last_duration = None
+
+    def _is_stale(self) -> bool:
+        if self._computed_at is None:
+            return True
+        return time.monotonic() - self._computed_at > self.ttl
+
+    def get(self, db: Session):
+        if self._is_stale():
+            # Aynı anda gelen istekler analizi bir kere çalıştırsın
+            with self._lock:
+                if self._is_stale():
+                    started = time.perf_counter()
+                    self._results = analyze(db)
+                    self.last_duration = time.perf_counter() - started
+                    self._computed_at = time.monotonic()
+        return self._results
+
+    def invalidate(self):
+        with self._lock:
+            self._computed_at = None
+
+
+item_analysis = ItemAnalysisCache()
+
+
+def main():
+    from tools.database import SessionLocal
+
+    with SessionLocal() as db:
+        started = time.perf_counter()
+        arrays = load_answer_arrays(db)
+        loaded = time.perf_counter()
+        results = analyze(db, arrays)
+        computed = time.perf_counter()
+
+    print(f"{len(arrays[0]):,} answers loaded in {loaded - started:.2f}s, "
+          f"{len(results):,} questions analysed in {computed - loaded:.3f}s")
+    print(f"{'external_id':>38} | {'sec':>3} | {'n':>7} | {'p':>5} | {'r_pb':>6}")
+    for r in results:
+        p = f"{r.p_value:.2f}" if r.p_value is not None else "-"
+        rpb = f"{r.point_biserial:.2f}" if r.point_biserial is not None else "-"
+        print(f"{r.external_id:>38} | {r.section:>3} | {r.responses:>7} | {p:>5} | {rpb:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# tools/leaderboard.py
+
+import os
+import time
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+from sqlalchemy.orm import Session
+from tools.models import User
+
+# Sınıf sıralamasının DB'den yeniden okunma süresi (saniye). Kendi process'indeki
+# gönderimler anında işlenir; diğer worker'lardakiler en geç bu süre sonunda görünür.
+LEADERBOARD_TTL = int(os.getenv("LEADERBOARD_TTL", "60"))
+
+# Sıralı listede aynı puanlı kayıtların başı / sonu için sınır değerler (user_id str)
+_LOWEST_ID = ""
+_HIGHEST_ID = "\uffff"
+
+LeaderboardEntry = namedtuple("LeaderboardEntry", ["rank", "user_id", "username", "full_name", "score"])
+StudentRank = namedtuple("StudentRank", ["rank", "class_size", "percentile", "score"])
+
+
+class ClassLeaderboard:
+    """
+    Bir sınıfın score_avg sıralaması.
+    (score, user_id) çiftleri artan sırada tutulur; sıra ve yüzdelik bisect ile
+    O(log n) bulunur, puan değişince kayıt çıkarılıp yeniden yerine eklenir.
+    Yalnızca en az bir sınava girmiş öğrenciler sıralamadadır.
+    """
+
+    def __init__(self):
+        self._sorted = []
+        self._scores = {}
+        self._names = {}
+        self.loaded_at = time.monotonic()
+
+    @property
+    def size(self) -> int:
+        return len(self._sorted)
+
+    def update(self, user_id: str, username: str, full_name: str, score: float):
+        old = self._scores.get(user_id)
+        if old is not None:
+            del self._sorted[bisect_left(self._sorted, (old, user_id))]
+        insort(self._sorted, (score, user_id))
+        self._scores[user_id] = score
+        self._names[user_id] = (username, full_name)
+
+    def _rank_of(self, score: float) -> int:
+        # Yarışma sıralaması: kendisinden yüksek puanlıların sayısı + 1
+        return self.size - bisect_right(self._sorted, (score, _HIGHEST_ID)) + 1
+
+    def rank(self, user_id: str):
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        below = bisect_left(self._sorted, (score, _LOWEST_ID))
+        at_most = bisect_right(self._sorted, (score, _HIGHEST_ID))
+        # Yüzdelik sıra: altındakiler + eşitlerin yarısı
+        percentile = 100.0 * (below + 0.5 * (at_most - below)) / self.size
+        return StudentRank(rank=self.size - at_most + 1, class_size=self.size, percentile=percentile, score=score)
+
+    def top(self, limit: int):
+        entries = []
+        for score, user_id in reversed(self._sorted[-limit:] if limit > 0 else []):
+            username, full_name = self._names[user_id]
+            entries.append(LeaderboardEntry(self._rank_of(score), user_id, username, full_name, score))
+        return entries
+
+
+class Leaderboards:
+    """(school_id, class_name) -> ClassLeaderboard; sınıflar ilk istekte yüklenir."""
+
+    def __init__(self, ttl: int = LEADERBOARD_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._boards = {}
+
+    def _is_stale(self, board) -> bool:
+        return self.ttl > 0 and time.monotonic() - board.loaded_at > self.ttl
+
+    def load(self, db: Session, school_id, class_name) -> ClassLeaderboard:
+        rows = db.query(User.user_id, User.username, User.name, User.surname, User.score_avg).filter(
+            User.school_id == school_id,
+            User.class_name == class_name,
+            User.role == "student",
+            User.attempts > 0
+        ).all()
+        board = ClassLeaderboard()
+        for user_id, username, name, surname, score_avg in rows:
+            board.update(str(user_id), username, f"{name} {surname}", score_avg or 0.0)
+        with self._lock:
+            self._boards[(school_id, class_name)] = board
+        return board
+
+    def board(self, db: Session, school_id, class_name) -> ClassLeaderboard:
+        board = self._boards.get((school_id, class_name))
+        if board is None or self._is_stale(board):
+            board = self.load(db, school_id, class_name)
+        return board
+
+    def rank(self, db: Session, school_id, class_name, user_id):
+        board = self.board(db, school_id, class_name)
+        with self._lock:
+            return board.rank(str(user_id))
+
+    def top(self, db: Session, school_id, class_name, limit: int):
+        """(sınıf mevcudu, ilk `limit` kayıt)"""
+        board = self.board(db, school_id, class_name)
+        with self._lock:
+            return board.size, board.top(limit)
+
+    def update(self, school_id, class_name, user_id, username, full_name, score):
+        """Gönderimden sonra çağrılır; sınıf henüz yüklenmediyse ilk okumada DB'den gelir."""
+        with self._lock:
+            board = self._boards.get((school_id, class_name))
+            if board is not None:
+                board.update(str(user_id), username, full_name, score)
+
+    def invalidate(self):
+        with self._lock:
+            self._boards = {}
+
+
+# Uygulama genelinde paylaşılan tek instance
+leaderboards = Leaderboards()
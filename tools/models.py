@@ -1,7 +1,7 @@
 # tools/models.py
 import uuid
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, Text, Table
-from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from sqlalchemy import Column, String, Integer, BigInteger, Float, Boolean, DateTime, ForeignKey, Text, Table, Index, Identity, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID as PGUUID
 from sqlalchemy.orm import relationship
 from tools.database import Base
 from datetime import datetime
@@ -61,6 +61,19 @@ class Question(Base):
     points = Column(Integer, nullable=False, default=1)
     type = Column(String(50), nullable=False)
 
+    # Rastgele soru seçimi için [0, 1) aralığında anahtar; SQL örnekleyici çektiği sorulara
+    # yeni anahtar verir (bkz. tools/exam.py SECTION_SAMPLE_SQL).
+    # (section, random_key) index'i sayesinde örnekleme tabloyu taramaz.
+    random_key = Column(Float, nullable=False, server_default=text("random()"))
+
+    # Soru bankasına eklenme sırası; "compact" sınav kağıtları seçilen soruları seq ile saklar.
+    seq = Column(BigInteger, Identity(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_questions_section_random_key", "section", "random_key"),
+        Index("ix_questions_seq", "seq", unique=True),
+    )
+
     # Soru ile ilişkili choices
     question_choices = relationship("QuestionChoice", back_populates="question", cascade="all, delete-orphan")
 
@@ -99,6 +112,21 @@ class Exam(Base):
     start_time = Column(DateTime, default=datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
 
+    # Compact kağıt: association satırları yerine seçilen soruların seq'leri (kağıt sırasıyla).
+    # NULL ise association kullanılır.
+    question_seqs = Column(ARRAY(BigInteger), nullable=True)
+
+    # Notlandırma transaction'ında bir kere yazılan sonuç özeti (bkz. tools/exam_summary.py):
+    # soru başına sonuç, seçilen metinler ve section toplamları. Eski sınavlarda NULL.
+    summary = Column(JSONB, nullable=True)
+
+    __table_args__ = (
+        # Öğrencinin açık sınavını (end_time NULL) bulmak için
+        Index("ix_exams_user_id_end_time", "user_id", "end_time"),
+        # Okul bazında kapanmış sınavları taramak için (istatistik yeniden hesaplama)
+        Index("ix_exams_school_id_end_time", "school_id", "end_time"),
+    )
+
     school_id = Column(PGUUID(as_uuid=True), ForeignKey("schools.school_id", ondelete='CASCADE'), nullable=False)
     school = relationship("School", back_populates="exams")
 
@@ -124,6 +152,12 @@ class ExamAnswer(Base):
 
     points_earned = Column(Integer, default=0)  # bu soru için kazanılan puan
 
+    __table_args__ = (
+        Index("ix_exam_answers_exam_id", "exam_id"),
+        # Cevap anahtarı değişen soruların cevaplarını id sırasıyla parça parça okumak için (regrade)
+        Index("ix_exam_answers_question_id_id", "question_id", "id"),
+    )
+
     exam = relationship("Exam", back_populates="exam_answers")
 
     # Bu cevaba ait seçilen choices
@@ -145,6 +179,10 @@ class UserChoice(Base):
 
     user_position = Column(Integer, nullable=True)  # ordering tipinde kullanıcı sıralama
 
+    __table_args__ = (
+        Index("ix_user_choices_exam_answer_id", "exam_answer_id"),
+    )
+
     exam_answer = relationship("ExamAnswer", back_populates="user_choices")
     # question_choice'a bir ilişki de istenirse eklenebilir
     # question_choice = relationship("QuestionChoice", ...)
@@ -160,5 +198,108 @@ class Statistics(Base):
     average_score = Column(Float, default=0.0)
     section_percentage = Column(Float, default=0.0)
 
+    # Ortalamanın yeniden hesaplanabilmesi için toplam ve sayaç
+    # average_score = score_sum / exam_count
+    score_sum = Column(Float, nullable=False, default=0.0)
+    exam_count = Column(Integer, nullable=False, default=0)
+
+    # Aynı sınıfın sayaçları STATS_SHARDS satıra bölünür; okurken shard'lar toplanır
+    shard = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
     school_id = Column(PGUUID(as_uuid=True), ForeignKey("schools.school_id"), nullable=False)
     school = relationship("School", back_populates="statistics")
+
+    __table_args__ = (
+        # INSERT ... ON CONFLICT hedefi
+        UniqueConstraint("school_id", "class_name", "section_number", "shard",
+                         name="uq_statistics_school_class_section_shard"),
+    )
+
+class StatisticsBucket(Base):
+    """
+    Zaman dilimli istatistik: (okul, sınıf, section) için saatlik ve günlük toplamlar.
+    bucket_start UTC, dilimin başlangıcı (saat başı / gün başı).
+    Ortalama ve yüzde saklanmaz; istenen aralıktaki dilimler toplanıp hesaplanır.
+    """
+    __tablename__ = "statistics_buckets"
+    id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    school_id = Column(PGUUID(as_uuid=True), ForeignKey("schools.school_id"), nullable=False)
+    class_name = Column(String(50), nullable=False)
+    section_number = Column(Integer, nullable=False)
+    granularity = Column(String(4), nullable=False)  # "hour" / "day"
+    bucket_start = Column(DateTime, nullable=False)
+    shard = Column(Integer, nullable=False, default=0, server_default=text("0"))
+
+    correct_questions = Column(Integer, nullable=False, default=0)
+    wrong_questions = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+    exam_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("school_id", "class_name", "section_number", "granularity", "bucket_start", "shard",
+                         name="uq_statistics_buckets_key"),
+        # Tüm okullar için tarih aralığı sorgusu (admin)
+        Index("ix_statistics_buckets_granularity_start", "granularity", "bucket_start"),
+    )
+
+class StatisticsHistogram(Base):
+    """
+    Section başarı yüzdesinin (sınav başına doğru / toplam * 100, tamsayıya yuvarlanmış)
+    dağılımı: her (okul, sınıf, section) için 0..100 arası 101 sabit kutu.
+    Kutular toplanarak birleştirilir; yüzdelikler kutulardan okunur.
+    """
+    __tablename__ = "statistics_histograms"
+    id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    school_id = Column(PGUUID(as_uuid=True), ForeignKey("schools.school_id"), nullable=False)
+    class_name = Column(String(50), nullable=False)
+    section_number = Column(Integer, nullable=False)
+    bin = Column(Integer, nullable=False)
+    shard = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    exam_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("school_id", "class_name", "section_number", "bin", "shard",
+                         name="uq_statistics_histograms_key"),
+    )
+
+class StatisticsRebuild(Base):
+    """
+    tools/rebuild_statistics.py çalıştırmaları. end_time'ı cutoff'tan önce olan tüm sınavlar
+    yeniden hesaplanan tablolarda sayılmıştır; write-behind toplayıcı bu sınavların henüz
+    yazmadığı deltaları atar (bkz. tools/stats_aggregator.py).
+    """
+    __tablename__ = "statistics_rebuilds"
+    id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    cutoff = Column(DateTime, nullable=False)
+    exam_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RegradeJob(Base):
+    """
+    Cevap anahtarı düzeltilen sorular için yeniden notlandırma işi (tools/regrade.py).
+    phase: rescore -> scores -> summaries -> done; yarıda kalan iş kaldığı yerden devam eder.
+    """
+    __tablename__ = "regrade_jobs"
+    job_id = Column(PGUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    question_ids = Column(ARRAY(PGUUID(as_uuid=True)), nullable=False)
+    phase = Column(String(20), nullable=False, default="rescore")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    chunks = relationship("RegradeChunk", back_populates="job", cascade="all, delete-orphan")
+
+
+class RegradeChunk(Base):
+    """Bir regrade işinin cevap parçası: [first_answer_id, next_answer_id) aralığı, id sırasıyla."""
+    __tablename__ = "regrade_chunks"
+    job_id = Column(PGUUID(as_uuid=True), ForeignKey("regrade_jobs.job_id", ondelete="CASCADE"), primary_key=True)
+    chunk_no = Column(Integer, primary_key=True)
+    first_answer_id = Column(PGUUID(as_uuid=True), nullable=False)
+    next_answer_id = Column(PGUUID(as_uuid=True), nullable=True)
+    answer_count = Column(Integer, nullable=False)
+    changed_answers = Column(Integer, nullable=True)
+    done = Column(Boolean, nullable=False, default=False)
+
+    job = relationship("RegradeJob", back_populates="chunks")
@@ -0,0 +1,240 @@
+# tools/question_cache.py
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from sqlalchemy.orm import Session, selectinload
+from tools.models import Question
+from tools.answer_key import compile_answer_key
+
+logger = logging.getLogger(__name__)
+
+# Cache yenileme süresi (saniye). Birden fazla worker çalışıyorsa diğer
+# process'lerde eklenen sorular en geç bu süre sonunda görünür hale gelir.
+QUESTION_CACHE_TTL = int(os.getenv("QUESTION_CACHE_TTL", "300"))
+
+# Soru parçası / cevap anahtarı cache'lerinin üst sınırı (soru sayısı). "sql" örnekleyicide
+# banka belleğe yüklenmediği için bu cache'ler tek başına büyür; en eski kullanılan atılır.
+QUESTION_MEMO_SIZE = int(os.getenv("QUESTION_MEMO_SIZE", "20000"))
+
+SECTIONS = (1, 2, 3, 4)
+
+# ORM nesneleri yerine hafif, değiştirilemez kayıtlar tutuyoruz.
+# Alan isimleri Question / QuestionChoice ile aynı, böylece mevcut kod
+# (q.id, q.section, q.question_choices ...) değişmeden çalışır.
+CachedChoice = namedtuple("CachedChoice", ["id", "choice_text", "is_correct", "correct_position"])
+CachedQuestion = namedtuple(
+    "CachedQuestion",
+    ["id", "external_id", "section", "question", "points", "type", "seq", "question_choices"]
+)
+
+
+def to_cached_question(q: Question) -> CachedQuestion:
+    return CachedQuestion(
+        id=q.id,
+        external_id=q.external_id,
+        section=q.section,
+        question=q.question,
+        points=q.points,
+        type=q.type,
+        seq=q.seq,
+        question_choices=tuple(
+            CachedChoice(c.id, c.choice_text, c.is_correct, c.correct_position)
+            for c in q.question_choices
+        )
+    )
+
+
+def question_fragment(q) -> str:
+    """Sorunun /exams/start cevabındaki JSON parçası (choices dahil)."""
+    return json.dumps({
+        "question_id": str(q.id),
+        "external_id": q.external_id,
+        "question": q.question,
+        "points": q.points,
+        "type": q.type,
+        "choices": [
+            {"choice_id": str(c.id), "choice_text": c.choice_text}
+            for c in q.question_choices
+        ]
+    }, ensure_ascii=False)
+
+
+class QuestionBankCache:
+    """
+    Soru bankasının process seviyesindeki kopyası.
+    Sorular ve şıkları bir kere yüklenir, section'a göre (seq sırasıyla) gruplanır;
+    /exams/start artık questions tablosunu taramaz.
+
+    version : bu process'te yüklenen içerik değiştiğinde artar (hazır kağıtların geçerliliği için)
+    """
+
+    def __init__(self, ttl: int = QUESTION_CACHE_TTL, memo_size: int = QUESTION_MEMO_SIZE):
+        self.ttl = ttl
+        self.memo_size = memo_size
+        self.version = 0
+        self._lock = threading.Lock()
+        # Aynı anda yalnızca bir yükleme (soğuk cache'te ilk istek yükler, diğerleri bekler)
+        self._load_lock = threading.Lock()
+        self._by_id = {}
+        self._by_seq = {}
+        self._by_section = {}
+        # question_id -> (soru, serialize edilmiş parça); soru içeriği değişmişse yeniden üretilir
+        self._fragments = OrderedDict()
+        # question_id -> (soru, derlenmiş cevap anahtarı); aynı kural
+        self._answer_keys = OrderedDict()
+        self._loaded_at = None
+
+    def _is_stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return self.ttl > 0 and time.monotonic() - self._loaded_at > self.ttl
+
+    def load(self, db: Session):
+        """Tüm soru bankasını (şıklarıyla birlikte) tek seferde yükler."""
+        questions = db.query(Question).options(selectinload(Question.question_choices)).order_by(Question.seq).all()
+        by_id = {}
+        by_section = {sec: [] for sec in SECTIONS}
+        for q in questions:
+            cq = to_cached_question(q)
+            by_id[cq.id] = cq
+            by_section.setdefault(cq.section, []).append(cq)
+
+        with self._lock:
+            self._loaded_at = time.monotonic()
+            # İçerik aynıysa (TTL yenilemesi) version artmaz; hazır kağıtlar ve
+            # parça / anahtar cache'leri geçerli kalır
+            if by_id == self._by_id:
+                return
+            self._by_id = by_id
+            self._by_seq = {cq.seq: cq for cq in by_id.values()}
+            self._by_section = {sec: tuple(qs) for sec, qs in by_section.items()}
+            self._fragments = OrderedDict()
+            self._answer_keys = OrderedDict()
+            self.version += 1
+
+    def ensure_loaded(self, db: Session):
+        if self._loaded_at is None:
+            # Soğuk cache: tek bir thread yükler, eşzamanlı istekler onun sonucunu kullanır
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self.load(db)
+        elif self._is_stale():
+            # Süresi dolmuş: eski kopya servis edilmeye devam eder, yenileme arka planda
+            self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        if not self._load_lock.acquire(blocking=False):
+            return  # zaten yükleniyor
+
+        def run():
+            from tools.database import SessionLocal
+            try:
+                with SessionLocal() as db:
+                    self.load(db)
+            except Exception as e:
+                logger.error(f"Question bank refresh failed: {e}")
+            finally:
+                self._load_lock.release()
+
+        threading.Thread(target=run, name="question-bank-refresh", daemon=True).start()
+
+    def section(self, db: Session, section: int):
+        self.ensure_loaded(db)
+        return self._by_section.get(section, ())
+
+    def get(self, db: Session, question_id):
+        self.ensure_loaded(db)
+        return self._by_id.get(question_id)
+
+    def get_by_seq(self, db: Session, seq: int):
+        self.ensure_loaded(db)
+        return self._by_seq.get(seq)
+
+    def _memo(self, memo, q, build):
+        """
+        Soru başına bir kere üretilen değer. Kayıt, üretildiği soru içeriğiyle saklanır;
+        aynı id farklı içerikle (ör. düzeltilmiş şıklar) gelirse yeniden üretilir.
+        """
+        entry = memo.get(q.id)
+        if entry is not None and (entry[0] is q or entry[0] == q):
+            with self._lock:
+                if q.id in memo:
+                    memo.move_to_end(q.id)
+            return entry[1]
+        value = build(q)
+        with self._lock:
+            memo[q.id] = (q, value)
+            memo.move_to_end(q.id)
+            while len(memo) > self.memo_size:
+                memo.popitem(last=False)
+        return value
+
+    def fragment(self, q) -> str:
+        return self._memo(self._fragments, q, question_fragment)
+
+    def answer_key(self, q):
+        return self._memo(self._answer_keys, q, compile_answer_key)
+
+    def forget_questions(self, question_ids):
+        """Verilen soruların parça / anahtar kayıtlarını siler (cevap anahtarı DB'de düzeltildiğinde)."""
+        with self._lock:
+            for question_id in question_ids:
+                self._fragments.pop(question_id, None)
+                self._answer_keys.pop(question_id, None)
+
+    def refresh_question(self, db: Session, question_id):
+        """
+        Tek bir soruyu (yeni eklenen / güncellenen) DB'den okuyup cache'e yazar.
+        Cache henüz yüklenmemişse bir sonraki okumada zaten tamamı yüklenecek.
+        """
+        if self._loaded_at is None:
+            self.forget_questions([question_id])
+            return
+        q = db.query(Question).options(selectinload(Question.question_choices)).filter(
+            Question.id == question_id
+        ).first()
+
+        if q is not None and question_id not in self._by_id and q.seq != max(self._by_seq, default=0) + 1:
+            # Araya başka worker'larda / oturumlarda eklenmiş sorular girmiş olabilir;
+            # tek soruyu eklemek yerine bankayı tamamen yeniden yükle
+            with self._load_lock:
+                self.load(db)
+            return
+
+        with self._lock:
+            old = self._by_id.get(question_id)
+            by_section = dict(self._by_section)
+            if old is not None:
+                by_section[old.section] = tuple(x for x in by_section.get(old.section, ()) if x.id != question_id)
+            by_id = dict(self._by_id)
+            by_seq = dict(self._by_seq)
+            if old is not None:
+                by_seq.pop(old.seq, None)
+            if q is None:
+                by_id.pop(question_id, None)
+            else:
+                cq = to_cached_question(q)
+                by_id[cq.id] = cq
+                by_seq[cq.seq] = cq
+                by_section[cq.section] = tuple(sorted(by_section.get(cq.section, ()) + (cq,), key=lambda x: x.seq))
+            self._by_id = by_id
+            self._by_seq = by_seq
+            self._by_section = by_section
+            self._fragments.pop(question_id, None)
+            self._answer_keys.pop(question_id, None)
+            self.version += 1
+
+    def invalidate(self):
+        """Bir sonraki okumada banka yeniden yüklenir; parça / anahtar kayıtları da atılır."""
+        with self._lock:
+            self._loaded_at = None
+            self._fragments = OrderedDict()
+            self._answer_keys = OrderedDict()
+
+
+# Uygulama genelinde paylaşılan tek instance
+question_bank = QuestionBankCache()
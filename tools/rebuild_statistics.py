@@ -0,0 +1,209 @@
+# tools/rebuild_statistics.py
+#
+# statistics, statistics_buckets ve statistics_histograms tablolarını ham sınav verisinden
+# (exams + exam_answers) baştan hesaplar ve tek transaction'da eskilerinin yerine koyar.
+#
+#   - Her okul ayrı bir worker process'te işlenir.
+#   - Cevaplar DB'de sınav + section başına özetlenir, server-side cursor ile parça parça
+#     (--chunk-size) okunur; bellekte yalnızca (okul, sınıf, section, saat) ve
+#     (okul, sınıf, section, histogram kutusu) başına toplamlar tutulur, satır sayısından bağımsızdır.
+#   - Değerlendirme process_results ile aynıdır: points_earned == points olan cevap doğru,
+#     skora yalnızca doğru cevapların puanı eklenir, her kapanmış sınav 4 section'ın
+#     exam_count'unu birer artırır.
+#
+# Kullanım:
+#   python -m tools.rebuild_statistics --workers 4 --chunk-size 50000
+#
+# Canlı trafikte de çalıştırılabilir:
+#   - Değiştirmeden önce süren gönderimler (kilitli açık sınavlar) beklenir; yenileri commit'e kadar bekler.
+#   - Değiştirme sırasında istatistik tabloları kilitlenir; o anda canlı yazılan istatistikler beklenir.
+#   - Kullanılan cutoff statistics_rebuilds tablosuna yazılır. Write-behind toplayıcı
+#     (STATS_WRITE_BEHIND=1) end_time'ı cutoff'tan önce olan, henüz flush etmediği deltaları atar;
+#     bu sınavlar yeni tablolarda zaten sayılmıştır. end_time uygulama sunucusunun saatiyle
+#     yazıldığından sunucu saatlerinin senkron olduğu varsayılır.
+
+import argparse
+import multiprocessing
+import time
+from datetime import datetime
+from sqlalchemy import insert, text
+
+from tools.database import engine
+from tools.models import StatisticsRebuild
+from tools.question_cache import SECTIONS
+from tools.statistics_utils import hour_bucket, score_bin, merge_deltas, merge_counts, statistics_statements
+
+# Kapanmış sınavların section bazında sonuçları (sınav başına en fazla 4 satır):
+# (okul, sınıf, bitiş zamanı, section, doğru sayısı, cevap sayısı, doğruların puanı)
+EXAM_SECTION_ROWS_SQL = """
+    SELECT e.school_id, e.class_name, e.end_time, q.section,
+           count(*) FILTER (WHERE ea.points_earned = q.points) AS correct,
+           count(*) AS answered,
+           coalesce(sum(ea.points_earned) FILTER (WHERE ea.points_earned = q.points), 0) AS score
+    FROM exams e
+    JOIN exam_answers ea ON ea.exam_id = e.exam_id
+    JOIN questions q ON q.id = ea.question_id
+    WHERE e.end_time IS NOT NULL AND {where}
+    GROUP BY e.exam_id, e.school_id, e.class_name, e.end_time, q.section
+"""
+
+# Kapanmış sınavlar (exam_count için)
+EXAM_ROWS_SQL = """
+    SELECT e.school_id, e.class_name, e.end_time
+    FROM exams e
+    WHERE e.end_time IS NOT NULL AND {where}
+"""
+
+SCHOOL_WHERE = "e.school_id = :school_id AND e.end_time < :cutoff"
+TAIL_WHERE = "e.end_time >= :cutoff AND e.end_time < :swap_cutoff"
+
+# Süren gönderimleri bekler: submit, sınav satırını end_time'ı belirlemeden önce kilitler
+# (FOR UPDATE). Bu ifade dönünce o ana kadar başlamış gönderimler commit edilmiş olur;
+# kilit tutulduğu sürece yeni gönderimler bekler ve end_time'ları bu andan sonradır.
+WAIT_FOR_SUBMISSIONS_SQL = """
+    SELECT count(*) FROM (SELECT 1 FROM exams WHERE end_time IS NULL FOR SHARE) s
+"""
+
+# Yeni satırlar bu büyüklükte gruplar halinde yazılır
+WRITE_BATCH = 5000
+
+
+def aggregate(conn, where, params, chunk_size, label=None):
+    """
+    Verilen koşuldaki kapanmış sınavları okuyup statistics_utils delta formatında toplar:
+      deltas: (school_id, class_name, section, saat dilimi) -> [correct, wrong, score_sum, exam_count]
+      bins  : (school_id, class_name, section, histogram kutusu) -> sınav sayısı
+    """
+    deltas = {}
+    bins = {}
+    answer_rows = 0
+    started = time.perf_counter()
+
+    result = conn.execute(
+        text(EXAM_SECTION_ROWS_SQL.format(where=where)), params, execution_options={"yield_per": chunk_size}
+    )
+    for chunk in result.partitions():
+        for school_id, class_name, end_time, section, correct, answered, score in chunk:
+            delta = deltas.setdefault((school_id, class_name, section, hour_bucket(end_time)), [0, 0, 0.0, 0])
+            delta[0] += correct
+            delta[1] += answered - correct
+            delta[2] += score
+            key = (school_id, class_name, section, score_bin(correct, answered))
+            bins[key] = bins.get(key, 0) + 1
+            answer_rows += answered
+        if label:
+            elapsed = time.perf_counter() - started
+            print(f"  [{label}] {answer_rows:,} answer rows, {answer_rows / elapsed:,.0f} rows/s", flush=True)
+
+    exam_rows = 0
+    result = conn.execute(
+        text(EXAM_ROWS_SQL.format(where=where)), params, execution_options={"yield_per": chunk_size}
+    )
+    for chunk in result.partitions():
+        for school_id, class_name, end_time in chunk:
+            hour = hour_bucket(end_time)
+            for section in SECTIONS:
+                delta = deltas.setdefault((school_id, class_name, section, hour), [0, 0, 0.0, 0])
+                delta[3] += 1
+        exam_rows += len(chunk)
+
+    return deltas, bins, answer_rows, exam_rows
+
+
+def _init_worker():
+    # Fork ile gelen bağlantı havuzunu paylaşma; her worker kendi bağlantılarını açar
+    engine.dispose(close=False)
+
+
+def rebuild_school(args):
+    school_id, cutoff, chunk_size = args
+    with engine.connect() as conn:
+        deltas, bins, answer_rows, exam_rows = aggregate(
+            conn, SCHOOL_WHERE, {"school_id": school_id, "cutoff": cutoff}, chunk_size, label=str(school_id)
+        )
+    return school_id, deltas, bins, answer_rows, exam_rows
+
+
+def wait_for_submissions(conn):
+    conn.execute(text(WAIT_FOR_SUBMISSIONS_SQL))
+
+
+def swap_statistics(deltas, bins, cutoff, chunk_size, exam_count):
+    """
+    Eski istatistikleri silip yenilerini tek transaction'da yazar.
+    Worker'lar okurken kapanan sınavlar (cutoff <= end_time < swap_cutoff) kilit altında ayrıca
+    eklenir; swap_cutoff statistics_rebuilds'e yazılır ve toplayıcılar ona göre delta atar.
+    """
+    with engine.begin() as conn:
+        wait_for_submissions(conn)
+        swap_cutoff = datetime.utcnow()
+        # Okumalar devam eder, canlı yazmalar (ve toplayıcı flush'ları) commit'e kadar bekler
+        conn.execute(text("LOCK TABLE statistics, statistics_buckets, statistics_histograms IN EXCLUSIVE MODE"))
+        params = {"cutoff": cutoff, "swap_cutoff": swap_cutoff}
+        tail, tail_bins, tail_rows, tail_exams = aggregate(conn, TAIL_WHERE, params, chunk_size)
+        merge_deltas(deltas, tail)
+        merge_counts(bins, tail_bins)
+
+        for table in ("statistics_histograms", "statistics_buckets", "statistics"):
+            conn.execute(text(f"DELETE FROM {table}"))
+        keys = list(deltas.keys())
+        for i in range(0, len(keys), WRITE_BATCH):
+            batch = {k: deltas[k] for k in keys[i:i + WRITE_BATCH]}
+            for stmt in statistics_statements(batch, 0):
+                conn.execute(stmt)
+        keys = list(bins.keys())
+        for i in range(0, len(keys), WRITE_BATCH):
+            batch = {k: bins[k] for k in keys[i:i + WRITE_BATCH]}
+            for stmt in statistics_statements({}, 0, batch):
+                conn.execute(stmt)
+        conn.execute(insert(StatisticsRebuild).values(cutoff=swap_cutoff, exam_count=exam_count + tail_exams))
+    return tail_rows, tail_exams
+
+
+def rebuild(workers, chunk_size):
+    """Tüm okulların istatistiklerini yeniden hesaplar."""
+    cutoff = datetime.utcnow()
+    with engine.begin() as conn:
+        # cutoff'tan önce kapanan sınavlar worker'lar okumaya başlamadan commit edilmiş olsun
+        wait_for_submissions(conn)
+        school_ids = [r[0] for r in conn.execute(text(
+            "SELECT DISTINCT school_id FROM exams WHERE end_time IS NOT NULL"
+        ))]
+    engine.dispose()
+    print(f"Rebuilding statistics for {len(school_ids)} schools with {workers} workers "
+          f"(exams closed before {cutoff.isoformat()} UTC).", flush=True)
+
+    started = time.perf_counter()
+    deltas = {}
+    bins = {}
+    total_answers = total_exams = 0
+    tasks = [(school_id, cutoff, chunk_size) for school_id in school_ids]
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        for done, (school_id, school_deltas, school_bins, answer_rows, exam_rows) in enumerate(
+            pool.imap_unordered(rebuild_school, tasks), start=1
+        ):
+            merge_deltas(deltas, school_deltas)
+            merge_counts(bins, school_bins)
+            total_answers += answer_rows
+            total_exams += exam_rows
+            elapsed = time.perf_counter() - started
+            print(f"[{done}/{len(tasks)}] school {school_id}: {exam_rows:,} exams, {answer_rows:,} answers | "
+                  f"total {total_answers:,} answers in {elapsed:.1f}s ({total_answers / elapsed:,.0f} rows/s)",
+                  flush=True)
+
+    tail_rows, tail_exams = swap_statistics(deltas, bins, cutoff, chunk_size, total_exams)
+    elapsed = time.perf_counter() - started
+    print(f"Statistics swapped: {total_exams + tail_exams:,} exams, {total_answers + tail_rows:,} answers "
+          f"({tail_exams:,} exams closed during the rebuild), {len(deltas):,} buckets in {elapsed:.1f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild class statistics from raw exam data.")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=50000, help="rows fetched per cursor round trip")
+    args = parser.parse_args()
+    rebuild(args.workers, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
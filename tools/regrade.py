@@ -0,0 +1,382 @@
+# tools/regrade.py
+#
+# Cevap anahtarı (QuestionChoice.is_correct / correct_position) düzeltilen sorular için
+# mevcut sınavları yeniden notlandırır:
+#
+#   1) rescore    : soruların exam_answers satırları id sırasıyla parçalara (regrade_chunks) bölünür;
+#                   worker process'ler her parçayı saklanan user_choices üzerinden yeniden puanlar
+#                   ve değişen puanları tek bir UPDATE ... FROM unnest(...) ile yazar. Değişen
+#                   cevapların istatistik farkları (doğru / yanlış / skor ve histogram kutusu) aynı
+#                   transaction'da statistics_statements ile eklenir. Parça, puanlarla aynı
+#                   transaction'da "done" işaretlenir; iş yarıda kalırsa kalan parçalardan devam edilir.
+#   2) scores     : etkilenen öğrencilerin score1 / score2 / score_avg değerleri tek SQL ile yeniden hesaplanır.
+#   3) summaries  : etkilenen sınavların sonuç özetleri (Exam.summary) yeniden yazılır.
+#
+# İstatistikler baştan hesaplanmaz, yalnızca farklar eklenir; uygulamanın henüz flush etmediği
+# write-behind deltaları etkilenmez, iş canlı trafik sırasında da çalıştırılabilir.
+#
+# Kullanım:
+#   python -m tools.regrade --question <question_id> [--question <question_id> ...] --workers 4
+#   python -m tools.regrade --resume <job_id>
+#
+# Not: Seçimler user_choices'tan okunur; şıklarla eşleşmeyen cevap metinleri (ör. "zzz")
+# gönderimde saklanmadığı için yeniden notlandırmada hesaba katılamaz.
+
+import argparse
+import multiprocessing
+import time
+from datetime import datetime
+from uuid import UUID
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+
+from tools.database import SessionLocal, engine
+from tools.models import Question, RegradeJob, RegradeChunk
+from tools.answer_key import compile_answer_key
+from tools.question_cache import to_cached_question
+from tools.batch_grader import encode_selections, grade_batch
+from tools.exam_summary import rebuild_summaries
+from tools.statistics_utils import (
+    hour_bucket, score_bin, merge_deltas, merge_counts, statistics_statements, pick_shard
+)
+
+PHASES = ("rescore", "scores", "summaries", "done")
+
+# Özetleri yeniden yazılan sınavlar için transaction başına sınav sayısı
+SUMMARY_BATCH = 500
+
+# Parça başlangıçları: id sırasıyla her chunk_size'ıncı cevap
+CHUNK_STARTS_SQL = """
+    SELECT id, total FROM (
+        SELECT id, row_number() OVER (ORDER BY id) AS rn, count(*) OVER () AS total
+        FROM exam_answers
+        WHERE question_id = ANY(:question_ids)
+    ) s
+    WHERE (rn - 1) % :chunk_size = 0
+    ORDER BY id
+"""
+
+CHUNK_ANSWERS_SQL = """
+    SELECT ea.id, ea.exam_id, ea.question_id, ea.points_earned, uc.question_choice_id, uc.user_position
+    FROM exam_answers ea
+    LEFT JOIN user_choices uc ON uc.exam_answer_id = ea.id
+    WHERE ea.question_id = ANY(:question_ids) AND ea.id >= :first_id {upper}
+    ORDER BY ea.id
+"""
+
+UPDATE_POINTS_SQL = """
+    UPDATE exam_answers ea SET points_earned = v.points
+    FROM unnest(CAST(:ids AS uuid[]), CAST(:points AS integer[])) AS v(id, points)
+    WHERE ea.id = v.id
+"""
+
+# process_results ile aynı formül: sınav yüzdesi = tam puanlı cevapların toplamı / 20 * 100,
+# 1. sınav score1, 2. sınav score2, score_avg ikisinin ortalaması (tek sınavsa score1)
+USER_SCORES_SQL = """
+    WITH affected AS (
+        SELECT DISTINCT e.user_id
+        FROM exam_answers ea
+        JOIN exams e ON e.exam_id = ea.exam_id
+        WHERE ea.question_id = ANY(:question_ids)
+    ),
+    exam_scores AS (
+        SELECT e.user_id,
+               row_number() OVER (PARTITION BY e.user_id ORDER BY e.end_time, e.exam_id) AS attempt,
+               coalesce(sum(ea.points_earned) FILTER (WHERE ea.points_earned = q.points), 0) / 20.0 * 100 AS pct
+        FROM exams e
+        JOIN affected a ON a.user_id = e.user_id
+        LEFT JOIN exam_answers ea ON ea.exam_id = e.exam_id
+        LEFT JOIN questions q ON q.id = ea.question_id
+        WHERE e.end_time IS NOT NULL
+        GROUP BY e.user_id, e.exam_id, e.end_time
+    ),
+    per_user AS (
+        SELECT user_id,
+               max(pct) FILTER (WHERE attempt = 1)::float AS s1,
+               max(pct) FILTER (WHERE attempt = 2)::float AS s2
+        FROM exam_scores
+        GROUP BY user_id
+    )
+    UPDATE users u
+    SET score1 = coalesce(p.s1, u.score1),
+        score2 = coalesce(p.s2, u.score2),
+        score_avg = CASE WHEN p.s2 IS NOT NULL THEN (p.s1 + p.s2) / 2
+                         WHEN p.s1 IS NOT NULL THEN p.s1
+                         ELSE u.score_avg END
+    FROM per_user p
+    WHERE u.user_id = p.user_id
+"""
+
+AFFECTED_EXAMS_SQL = """
+    SELECT DISTINCT e.exam_id
+    FROM exam_answers ea
+    JOIN exams e ON e.exam_id = ea.exam_id
+    WHERE ea.question_id = ANY(:question_ids) AND e.end_time IS NOT NULL
+"""
+
+# Puanı değişen cevapların sınavları, sabit sırayla kilitlenir: aynı sınavın cevapları farklı
+# parçalarda olabilir, paralel parçalar sınavın section sayılarını sırayla okuyup değiştirsin
+LOCK_EXAMS_SQL = """
+    SELECT exam_id FROM exams
+    WHERE exam_id = ANY(CAST(:exam_ids AS uuid[]))
+    ORDER BY exam_id
+    FOR NO KEY UPDATE
+"""
+
+# Kilitli sınavların bu parçadan önceki section sonuçları (histogram kutusu için)
+EXAM_SECTIONS_SQL = """
+    SELECT e.exam_id, e.school_id, e.class_name, e.end_time, q.section,
+           count(*) FILTER (WHERE ea.points_earned = q.points) AS correct,
+           count(*) AS answered
+    FROM exams e
+    JOIN exam_answers ea ON ea.exam_id = e.exam_id
+    JOIN questions q ON q.id = ea.question_id
+    WHERE e.exam_id = ANY(CAST(:exam_ids AS uuid[])) AND e.end_time IS NOT NULL
+    GROUP BY e.exam_id, e.school_id, e.class_name, e.end_time, q.section
+"""
+
+
+def create_job(question_ids, chunk_size) -> UUID:
+    """İşi ve parçalarını oluşturur."""
+    with SessionLocal() as db:
+        job = RegradeJob(question_ids=list(question_ids), phase="rescore")
+        db.add(job)
+        db.flush()
+        starts = db.execute(text(CHUNK_STARTS_SQL), {
+            "question_ids": list(question_ids), "chunk_size": chunk_size
+        }).all()
+        for chunk_no, (first_id, total) in enumerate(starts):
+            db.add(RegradeChunk(
+                job_id=job.job_id,
+                chunk_no=chunk_no,
+                first_answer_id=first_id,
+                next_answer_id=starts[chunk_no + 1][0] if chunk_no + 1 < len(starts) else None,
+                answer_count=min(chunk_size, total - chunk_no * chunk_size),
+                done=False
+            ))
+        job_id = job.job_id
+        db.commit()
+    return job_id
+
+
+def stored_selection(question, key, choices):
+    """
+    Saklanan seçimlerden (question_choice_id, user_position) normalize seçim listesini kurar.
+    Ordering'de seçimler user_position'daki yerlerine konur; boşluklar hiçbir şıkla eşleşmez.
+    """
+    if question.type == "ordering":
+        positioned = [(pos, cid) for cid, pos in choices if pos is not None]
+        selected = [None] * (max((pos for pos, _ in positioned), default=-1) + 1)
+        for pos, cid in positioned:
+            selected[pos] = key.norm_by_id.get(cid)
+    else:
+        selected = [key.norm_by_id.get(cid) for cid, _ in choices]
+    return selected
+
+
+# Worker process içinde job başına derlenmiş sorular: job_id -> {question_id: (soru, anahtar)}
+_worker_keys = {}
+
+
+def _init_worker():
+    # Fork ile gelen bağlantı havuzunu paylaşma; her worker kendi bağlantılarını açar
+    engine.dispose(close=False)
+
+
+def _question_keys(db, job_id, question_ids):
+    keys = _worker_keys.get(job_id)
+    if keys is None:
+        questions = db.query(Question).options(selectinload(Question.question_choices)).filter(
+            Question.id.in_(question_ids)
+        ).all()
+        keys = {}
+        for q in questions:
+            cq = to_cached_question(q)
+            keys[cq.id] = (cq, compile_answer_key(cq))
+        _worker_keys[job_id] = keys
+    return keys
+
+
+def statistics_changes(changes, exam_sections):
+    """
+    Puanı değişen cevapların istatistik farkları (statistics_utils delta formatında).
+      changes       : (exam_id, section, points, eski puan, yeni puan)
+      exam_sections : (exam_id, section) -> (school_id, class_name, end_time, doğru, cevap sayısı)
+    Doğruluk process_results'taki gibi "tam puan"; skor yalnızca doğru cevapların puanı.
+    Section'ı değişen sınav histogramda eski kutudan yeni kutuya taşınır; exam_count değişmez.
+    """
+    moved = {}
+    for exam_id, section, points, old_points, new_points in changes:
+        diff = int(new_points == points) - int(old_points == points)
+        if diff:
+            entry = moved.setdefault((exam_id, section), [0, 0])
+            entry[0] += diff
+            entry[1] += diff * points
+
+    deltas = {}
+    bins = {}
+    for (exam_id, section), (correct_diff, score_diff) in moved.items():
+        sec = exam_sections.get((exam_id, section))
+        if sec is None or correct_diff == 0:
+            continue  # kapanmamış sınav ya da birbirini götüren değişiklikler
+        school_id, class_name, end_time, correct, answered = sec
+        merge_deltas(deltas, {
+            (school_id, class_name, section, hour_bucket(end_time)): [correct_diff, -correct_diff, score_diff, 0]
+        })
+        old_bin, new_bin = score_bin(correct, answered), score_bin(correct + correct_diff, answered)
+        if old_bin != new_bin:
+            merge_counts(bins, {(school_id, class_name, section, old_bin): -1})
+            merge_counts(bins, {(school_id, class_name, section, new_bin): 1})
+    return deltas, {k: n for k, n in bins.items() if n}
+
+
+def rescore_chunk(args):
+    """Bir parçayı yeniden puanlar; (chunk_no, cevap sayısı, değişen sayısı) döner."""
+    job_id, chunk_no = args
+    with SessionLocal() as db:
+        chunk = db.query(RegradeChunk).filter(
+            RegradeChunk.job_id == job_id, RegradeChunk.chunk_no == chunk_no
+        ).with_for_update().one()
+        if chunk.done:
+            return chunk_no, chunk.answer_count, chunk.changed_answers or 0
+        job = db.get(RegradeJob, job_id)
+        keys = _question_keys(db, job_id, job.question_ids)
+
+        params = {"question_ids": job.question_ids, "first_id": chunk.first_answer_id}
+        upper = ""
+        if chunk.next_answer_id is not None:
+            upper = "AND ea.id < :next_id"
+            params["next_id"] = chunk.next_answer_id
+        rows = db.execute(text(CHUNK_ANSWERS_SQL.format(upper=upper)), params).all()
+
+        # Satırlar cevap id'sine göre sıralı; aynı cevabın seçimlerini grupla
+        answers = {}
+        for answer_id, exam_id, question_id, points_earned, choice_id, position in rows:
+            entry = answers.get(answer_id)
+            if entry is None:
+                entry = answers[answer_id] = (exam_id, question_id, points_earned, [])
+            if choice_id is not None:
+                entry[3].append((choice_id, position))
+
+        # Soru başına tüm cevaplar tek seferde (batch_grader) puanlanır
+        by_question = {}
+        for answer_id, (exam_id, question_id, points_earned, choices) in answers.items():
+            by_question.setdefault(question_id, []).append((answer_id, exam_id, points_earned, choices))
+
+        changed_ids = []
+        changed_points = []
+        changes = []
+        for question_id, entries in by_question.items():
+            question, key = keys[question_id]
+            batch = encode_selections(key, [stored_selection(question, key, choices) for *_, choices in entries])
+            points, _ = grade_batch(question, key, batch)
+            for (answer_id, exam_id, points_earned, _), new_points in zip(entries, points.tolist()):
+                if new_points != points_earned:
+                    changed_ids.append(str(answer_id))
+                    changed_points.append(new_points)
+                    changes.append((exam_id, question.section, question.points, points_earned, new_points))
+
+        if changed_ids:
+            exam_ids = sorted({str(exam_id) for exam_id, *_ in changes})
+            db.execute(text(LOCK_EXAMS_SQL), {"exam_ids": exam_ids})
+            exam_sections = {
+                (r.exam_id, r.section): (r.school_id, r.class_name, r.end_time, r.correct, r.answered)
+                for r in db.execute(text(EXAM_SECTIONS_SQL), {"exam_ids": exam_ids})
+            }
+            deltas, bins = statistics_changes(changes, exam_sections)
+            db.execute(text(UPDATE_POINTS_SQL), {"ids": changed_ids, "points": changed_points})
+            for stmt in statistics_statements(deltas, pick_shard(), bins):
+                db.execute(stmt)
+        chunk.changed_answers = len(changed_ids)
+        chunk.done = True
+        db.commit()
+        return chunk_no, len(answers), len(changed_ids)
+
+
+def set_phase(job_id, phase):
+    with SessionLocal() as db:
+        job = db.get(RegradeJob, job_id)
+        job.phase = phase
+        if phase == "done":
+            job.finished_at = datetime.utcnow()
+        db.commit()
+
+
+def run_job(job_id, workers, chunk_size):
+    with SessionLocal() as db:
+        job = db.get(RegradeJob, job_id)
+        if job is None:
+            raise SystemExit(f"Regrade job {job_id} not found.")
+        phase = job.phase
+        question_ids = list(job.question_ids)
+        pending = [c.chunk_no for c in db.query(RegradeChunk.chunk_no).filter(
+            RegradeChunk.job_id == job_id, RegradeChunk.done.is_(False)
+        ).order_by(RegradeChunk.chunk_no)]
+        total, done_answers = db.execute(text(
+            "SELECT coalesce(sum(answer_count), 0), coalesce(sum(answer_count) FILTER (WHERE done), 0) "
+            "FROM regrade_chunks WHERE job_id = :job_id"
+        ), {"job_id": job_id}).one()
+    print(f"Regrade job {job_id}: phase={phase}, {len(question_ids)} questions, {total:,} answers "
+          f"({done_answers:,} already rescored).", flush=True)
+
+    if phase == "rescore":
+        engine.dispose()
+        started = time.perf_counter()
+        processed = changed = 0
+        with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+            for chunk_no, count, chunk_changed in pool.imap_unordered(
+                rescore_chunk, [(job_id, n) for n in pending]
+            ):
+                processed += count
+                changed += chunk_changed
+                elapsed = time.perf_counter() - started
+                rate = processed / elapsed if elapsed > 0 else 0
+                remaining = total - done_answers - processed
+                eta = remaining / rate if rate > 0 else 0
+                print(f"  chunk {chunk_no}: {done_answers + processed:,}/{total:,} answers, {changed:,} changed "
+                      f"| {rate:,.0f} answers/s, ETA {eta:.0f}s", flush=True)
+        phase = "scores"
+        set_phase(job_id, phase)
+
+    if phase == "scores":
+        with engine.begin() as conn:
+            result = conn.execute(text(USER_SCORES_SQL), {"question_ids": question_ids})
+        print(f"User scores recomputed for {result.rowcount:,} students.", flush=True)
+        phase = "summaries"
+        set_phase(job_id, phase)
+
+    if phase == "summaries":
+        with SessionLocal() as db:
+            exam_ids = [r[0] for r in db.execute(text(AFFECTED_EXAMS_SQL), {"question_ids": question_ids})]
+            for i in range(0, len(exam_ids), SUMMARY_BATCH):
+                rebuild_summaries(db, exam_ids[i:i + SUMMARY_BATCH])
+                db.commit()
+        print(f"Result summaries rewritten for {len(exam_ids):,} exams.", flush=True)
+        set_phase(job_id, "done")
+
+    print(f"Regrade job {job_id} done.")
+    # Çalışan API process'leri düzeltilmiş anahtarı en geç QUESTION_CACHE_TTL sonunda görür
+    print("New submissions use the corrected key after POST /questions/cache/refresh "
+          "(or once QUESTION_CACHE_TTL expires) on each API worker.", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regrade existing exams after answer-key changes.")
+    parser.add_argument("--question", type=UUID, action="append", default=[], help="question id (repeatable)")
+    parser.add_argument("--resume", type=UUID, help="continue an unfinished regrade job")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=20000, help="answers per rescore chunk")
+    args = parser.parse_args()
+
+    if args.resume:
+        job_id = args.resume
+    elif args.question:
+        job_id = create_job(args.question, args.chunk_size)
+        print(f"Created regrade job {job_id} (resume with --resume {job_id}).", flush=True)
+    else:
+        parser.error("either --question or --resume is required")
+    run_job(job_id, args.workers, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
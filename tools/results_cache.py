@@ -0,0 +1,84 @@
+# tools/results_cache.py
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Önbellekte tutulacak en fazla öğrenci sayısı; dolunca en uzun süredir okunmayan atılır (LRU)
+RESULTS_CACHE_SIZE = int(os.getenv("RESULTS_CACHE_SIZE", "10000"))
+# Kayıt ömrü (saniye). Gönderim kendi process'inde kaydı siler; diğer worker'lardaki
+# gönderimler ve yeniden notlandırmalar kayıttaki attempts / score_avg ile de yakalanır,
+# TTL yalnızca son güvence.
+RESULTS_CACHE_TTL = int(os.getenv("RESULTS_CACHE_TTL", "300"))
+
+
+class ResultsCache:
+    """
+    user_id -> öğrencinin /students/results cevabı.
+    İlk okumada doldurulur, process_results commit'inden sonra silinir.
+    Kayıt, kullanıcının o anki attempts ve score_avg değerleriyle eşleşmiyorsa kullanılmaz.
+    """
+
+    def __init__(self, max_size: int = RESULTS_CACHE_SIZE, ttl: int = RESULTS_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user):
+        key = str(user.user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                attempts, score_avg, stored_at, value = entry
+                fresh = self.ttl <= 0 or time.monotonic() - stored_at <= self.ttl
+                if fresh and attempts == user.attempts and score_avg == user.score_avg:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, user, value):
+        if self.max_size <= 0:
+            return
+        key = str(user.user_id)
+        with self._lock:
+            self._entries[key] = (user.attempts, user.score_avg, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(str(user_id), None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Uygulama genelinde paylaşılan tek instance
+results_cache = ResultsCache()
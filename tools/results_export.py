@@ -0,0 +1,83 @@
+# tools/results_export.py
+#
+# Bir okulun tüm sınav sonuçlarını cevap başına bir satır olarak dışa aktarır (CSV / NDJSON).
+# Satırlar server-side cursor (yield_per) ile parça parça okunur ve parça parça yazılır;
+# bellek kullanımı sonuç sayısından bağımsızdır. Sorgu sıralaması (school_id, end_time)
+# index'ini izlediği için ilk satırlar tüm sonuç sıralanmadan gelmeye başlar.
+
+import csv
+import io
+import json
+import os
+from sqlalchemy import text
+from tools.database import SessionLocal
+
+# Cursor'dan bir seferde okunan ve tek parça olarak gönderilen satır sayısı
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+EXPORT_COLUMNS = [
+    "exam_id", "user_id", "username", "class_name", "start_time", "end_time",
+    "question_id", "external_id", "section", "question_type", "points", "points_earned", "is_correct", "chosen"
+]
+
+# Seçilen şık metinleri cevap başına alt sorguyla toplanır (ordering'de kullanıcı sırasıyla)
+EXPORT_SQL = """
+    SELECT e.exam_id, u.user_id, u.username, e.class_name, e.start_time, e.end_time,
+           q.id, q.external_id, q.section, q.type, q.points, ea.points_earned,
+           ea.points_earned = q.points,
+           ARRAY(
+               SELECT qc.choice_text
+               FROM user_choices uc
+               JOIN question_choices qc ON qc.id = uc.question_choice_id
+               WHERE uc.exam_answer_id = ea.id
+               ORDER BY uc.user_position, uc.id
+           )
+    FROM exams e
+    JOIN users u ON u.user_id = e.user_id
+    JOIN exam_answers ea ON ea.exam_id = e.exam_id
+    JOIN questions q ON q.id = ea.question_id
+    WHERE e.school_id = :school_id AND e.end_time IS NOT NULL
+    ORDER BY e.end_time, e.exam_id
+"""
+
+
+def export_batches(school_id, batch_size: int = EXPORT_BATCH_SIZE):
+    """Satır listeleri üretir; kendi session'ını açar (StreamingResponse isteğin session'ından uzun yaşar)."""
+    with SessionLocal() as db:
+        result = db.execute(text(EXPORT_SQL), {"school_id": school_id}, execution_options={"yield_per": batch_size})
+        # Parça boyu açıkça verilir; yoksa partitions() text sorgularında tüm sonucu tek parça döner
+        for rows in result.partitions(batch_size):
+            yield rows
+
+
+def _row_values(row):
+    (exam_id, user_id, username, class_name, start_time, end_time,
+     question_id, external_id, section, q_type, points, points_earned, is_correct, chosen) = row
+    return [
+        str(exam_id), str(user_id), username, class_name,
+        start_time.isoformat() if start_time else None, end_time.isoformat(),
+        str(question_id), external_id, section, q_type, points, points_earned, bool(is_correct), chosen
+    ]
+
+
+def csv_stream(school_id):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buf.getvalue()
+    for rows in export_batches(school_id):
+        buf.seek(0)
+        buf.truncate()
+        for row in rows:
+            values = _row_values(row)
+            values[-1] = ", ".join(values[-1])
+            writer.writerow(values)
+        yield buf.getvalue()
+
+
+def ndjson_stream(school_id):
+    for rows in export_batches(school_id):
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, _row_values(row))), ensure_ascii=False) + "\n"
+            for row in rows
+        )
@@ -1,45 +1,327 @@
 # tools/statistics_utils.py
 
+import math
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, case, func, or_, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from tools.models import Statistics
+from tools.models import Statistics, StatisticsBucket, StatisticsHistogram, StatisticsRebuild
 
-def update_statistics(db: Session, school_id, class_name, section_correct, section_wrong, section_scores):
+# Bir sınıfın her section sayacı bu kadar satıra (shard) bölünür.
+# Eşzamanlı submit'ler farklı shard'lara düşerek aynı satır kilidini beklemez.
+STATS_SHARDS = max(1, int(os.getenv("STATS_SHARDS", "8")))
+
+HOUR = "hour"
+DAY = "day"
+
+# Histogram: sınav başına section başarı yüzdesi, 0..100 tamsayı kutular
+HISTOGRAM_BINS = 101
+# Dağılım cevapta 10'ar puanlık bantlar halinde döner (son bant 90-100)
+DISTRIBUTION_BAND = 10
+
+def pick_shard() -> int:
+    return random.randrange(STATS_SHARDS)
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+def day_bucket(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def to_utc_naive(ts: datetime) -> datetime:
+    # Sınav zamanları (exam.end_time) naive UTC tutuluyor
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def section_deltas(school_id, class_name, section_correct, section_wrong, section_scores, end_time=None):
+    """
+    Bir gönderimin istatistik deltaları:
+    (school_id, class_name, section_number, saat dilimi) -> [correct, wrong, score_sum, exam_count]
+    """
+    hour = hour_bucket(end_time or datetime.utcnow())
+    return {
+        (school_id, class_name, section, hour): [
+            section_correct[section], section_wrong[section], section_scores[section], 1
+        ]
+        for section in section_correct.keys()
+    }
+
+def score_bin(correct: int, total: int) -> int:
+    # Yarım yukarı yuvarlama (round() bankacı yuvarlaması yapar)
+    return int(correct * 100 / total + 0.5)
+
+def section_bins(school_id, class_name, section_correct, section_wrong):
+    """
+    Bir gönderimin histogram deltaları: (school_id, class_name, section_number, kutu) -> sınav sayısı.
+    Hiç sorusu olmayan section dağılıma girmez.
+    """
+    bins = {}
     for section in section_correct.keys():
-        stat = db.query(Statistics).filter(
-            Statistics.school_id == school_id,
-            Statistics.class_name == class_name,
-            Statistics.section_number == section
-        ).first()
-
-        c = section_correct[section]
-        w = section_wrong[section]
-        s = section_scores[section]
-
-        if not stat:
-            total_questions = c + w
-            section_percentage = (c / total_questions * 100) if total_questions > 0 else 0
-            stat = Statistics(
-                school_id=school_id,
-                class_name=class_name,
-                section_number=section,
-                correct_questions=c,
-                wrong_questions=w,
-                average_score=s,
-                section_percentage=section_percentage
-            )
-            db.add(stat)
-        else:
-            stat.correct_questions += c
-            stat.wrong_questions += w
-            old_avg = stat.average_score
-            if old_avg == 0:
-                stat.average_score = s
-            else:
-                stat.average_score = (old_avg + s) / 2
-
-            new_total_correct = stat.correct_questions
-            new_total_wrong = stat.wrong_questions
-            new_total_questions = new_total_correct + new_total_wrong
-            stat.section_percentage = (new_total_correct / new_total_questions * 100) if new_total_questions > 0 else 0
-
-        db.commit()
+        total = section_correct[section] + section_wrong[section]
+        if total > 0:
+            bins[(school_id, class_name, section, score_bin(section_correct[section], total))] = 1
+    return bins
+
+def merge_counts(target: dict, counts: dict):
+    for key, n in counts.items():
+        target[key] = target.get(key, 0) + n
+
+def merge_deltas(target: dict, deltas: dict):
+    for key, (c, w, s, n) in deltas.items():
+        delta = target.setdefault(key, [0, 0, 0.0, 0])
+        delta[0] += c
+        delta[1] += w
+        delta[2] += s
+        delta[3] += n
+
+def _key_order(key):
+    # Sabit sıra: birden fazla transaction aynı satırları kilitlerken deadlock olmasın
+    return (str(key[0]), key[1] or "") + tuple(key[2:])
+
+def statistics_statements(deltas: dict, shard: int, bins: dict = None):
+    """
+    Deltaları yazan UPSERT'ler: genel toplam (Statistics), saatlik + günlük dilimler
+    (StatisticsBucket) ve verilmişse histogram kutuları (StatisticsHistogram).
+    Aynı anahtara düşen deltalar önceden toplanır.
+    """
+    totals = {}
+    buckets = {}
+    for (school_id, class_name, section, hour), delta in deltas.items():
+        merge_deltas(totals, {(school_id, class_name, section): delta})
+        merge_deltas(buckets, {
+            (school_id, class_name, section, HOUR, hour): delta,
+            (school_id, class_name, section, DAY, day_bucket(hour)): delta,
+        })
+    statements = []
+    if totals:
+        statements.append(
+            statistics_upsert([statistics_row(*k, *totals[k], shard) for k in sorted(totals, key=_key_order)])
+        )
+        statements.append(
+            bucket_upsert([bucket_row(*k, *buckets[k], shard) for k in sorted(buckets, key=_key_order)])
+        )
+    if bins:
+        statements.append(
+            histogram_upsert([histogram_row(*k, bins[k], shard) for k in sorted(bins, key=_key_order)])
+        )
+    return statements
+
+def rebuild_cutoff(db: Session):
+    """
+    Son istatistik yeniden hesaplamasının cutoff'u (hiç yapılmadıysa None).
+    Önce statistics tablosu ROW EXCLUSIVE kilitlenir: süren bir değiştirme (EXCLUSIVE kilit)
+    varsa commit'i beklenir; okunan cutoff, aynı transaction'da yazılacak deltalar için geçerlidir.
+    """
+    db.execute(text("LOCK TABLE statistics IN ROW EXCLUSIVE MODE"))
+    return db.query(func.max(StatisticsRebuild.cutoff)).scalar()
+
+def update_statistics(db: Session, school_id, class_name, section_correct, section_wrong, section_scores,
+                      end_time=None):
+    # Commit çağıranın (process_results) transaction'ında yapılır.
+    # Section'lar INSERT ... ON CONFLICT DO UPDATE ile, satır kilidi altında
+    # atomik olarak artırılır (önce okuyup Python'da değiştirme yok, yarış yok).
+    # Bir gönderimin dört section'ı aynı shard'a yazılır
+    deltas = section_deltas(school_id, class_name, section_correct, section_wrong, section_scores, end_time)
+    bins = section_bins(school_id, class_name, section_correct, section_wrong)
+    for stmt in statistics_statements(deltas, pick_shard(), bins):
+        db.execute(stmt)
+
+def statistics_row(school_id, class_name, section, correct, wrong, score_sum, exam_count, shard=0):
+    """Tek bir (okul, sınıf, section, shard) için upsert satırı; değerler eklenecek deltalardır."""
+    total_questions = correct + wrong
+    return {
+        "school_id": school_id,
+        "class_name": class_name,
+        "section_number": section,
+        "shard": shard,
+        "correct_questions": correct,
+        "wrong_questions": wrong,
+        "score_sum": score_sum,
+        "exam_count": exam_count,
+        "average_score": score_sum / exam_count if exam_count > 0 else 0,
+        "section_percentage": (correct / total_questions * 100) if total_questions > 0 else 0
+    }
+
+def bucket_row(school_id, class_name, section, granularity, bucket_start, correct, wrong, score_sum, exam_count,
+               shard=0):
+    return {
+        "school_id": school_id,
+        "class_name": class_name,
+        "section_number": section,
+        "granularity": granularity,
+        "bucket_start": bucket_start,
+        "shard": shard,
+        "correct_questions": correct,
+        "wrong_questions": wrong,
+        "score_sum": score_sum,
+        "exam_count": exam_count
+    }
+
+def histogram_row(school_id, class_name, section, bin, exam_count, shard=0):
+    return {
+        "school_id": school_id,
+        "class_name": class_name,
+        "section_number": section,
+        "bin": bin,
+        "shard": shard,
+        "exam_count": exam_count
+    }
+
+def statistics_upsert(rows):
+    """
+    Verilen satırları (school_id, class_name, section_number, shard) anahtarına göre
+    toplayarak yazan INSERT ... ON CONFLICT DO UPDATE ifadesi.
+    SET içindeki Statistics.* referansları satırın mevcut (eski) değerleridir.
+    """
+    stmt = insert(Statistics).values(rows)
+    excluded = stmt.excluded
+
+    new_correct = Statistics.correct_questions + excluded.correct_questions
+    new_wrong = Statistics.wrong_questions + excluded.wrong_questions
+    new_score_sum = Statistics.score_sum + excluded.score_sum
+    new_exam_count = Statistics.exam_count + excluded.exam_count
+
+    return stmt.on_conflict_do_update(
+        constraint="uq_statistics_school_class_section_shard",
+        set_={
+            "correct_questions": new_correct,
+            "wrong_questions": new_wrong,
+            "score_sum": new_score_sum,
+            "exam_count": new_exam_count,
+            "average_score": case(
+                (new_exam_count > 0, new_score_sum / new_exam_count),
+                else_=0.0
+            ),
+            "section_percentage": case(
+                (new_correct + new_wrong > 0, new_correct * 100.0 / (new_correct + new_wrong)),
+                else_=0.0
+            ),
+        }
+    )
+
+def bucket_upsert(rows):
+    """Zaman dilimi satırlarını statistics_upsert gibi toplayarak yazar."""
+    stmt = insert(StatisticsBucket).values(rows)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        constraint="uq_statistics_buckets_key",
+        set_={
+            "correct_questions": StatisticsBucket.correct_questions + excluded.correct_questions,
+            "wrong_questions": StatisticsBucket.wrong_questions + excluded.wrong_questions,
+            "score_sum": StatisticsBucket.score_sum + excluded.score_sum,
+            "exam_count": StatisticsBucket.exam_count + excluded.exam_count,
+        }
+    )
+
+def histogram_upsert(rows):
+    stmt = insert(StatisticsHistogram).values(rows)
+    return stmt.on_conflict_do_update(
+        constraint="uq_statistics_histograms_key",
+        set_={"exam_count": StatisticsHistogram.exam_count + stmt.excluded.exam_count}
+    )
+
+def _rollup(db: Session, model, school_id=None, class_name=None, section_number=None, *conditions):
+    """
+    Shard'ları (ve zaman dilimlerini) toplayarak (okul, sınıf, section) başına tek satır döner.
+    Ortalama ve yüzde toplam sayaçlardan yeniden hesaplanır.
+    """
+    filters = list(conditions)
+    if school_id is not None:
+        filters.append(model.school_id == school_id)
+    if class_name is not None:
+        filters.append(model.class_name == class_name)
+    if section_number is not None:
+        filters.append(model.section_number == section_number)
+
+    correct = func.sum(model.correct_questions)
+    wrong = func.sum(model.wrong_questions)
+    score_sum = func.sum(model.score_sum)
+    exam_count = func.sum(model.exam_count)
+    return db.query(
+        model.school_id,
+        model.class_name,
+        model.section_number,
+        correct.label("correct_questions"),
+        wrong.label("wrong_questions"),
+        case((exam_count > 0, score_sum / exam_count), else_=0.0).label("average_score"),
+        case((correct + wrong > 0, correct * 100.0 / (correct + wrong)), else_=0.0).label("section_percentage"),
+    ).filter(*filters).group_by(
+        model.school_id, model.class_name, model.section_number
+    ).order_by(
+        model.school_id, model.class_name, model.section_number
+    ).all()
+
+def statistics_rollup(db: Session, school_id=None, class_name=None, section_number=None):
+    """Tüm zamanlar için toplam istatistik."""
+    return _rollup(db, Statistics, school_id, class_name, section_number)
+
+def bucket_rollup(db: Session, start: datetime, end: datetime, school_id=None, class_name=None, section_number=None):
+    """
+    [start, end) aralığının istatistiği (saat hassasiyetinde; start aşağı, end yukarı yuvarlanır).
+    Aralığın içindeki tam günler günlük dilimlerden, baştaki ve sondaki
+    kısmi günler saatlik dilimlerden okunur.
+    """
+    start = hour_bucket(start)
+    end_hour = hour_bucket(end)
+    end = end_hour if end_hour == end else end_hour + timedelta(hours=1)
+
+    first_day = day_bucket(start)
+    if first_day < start:
+        first_day += timedelta(days=1)
+    last_day = day_bucket(end)
+
+    b = StatisticsBucket
+    if first_day < last_day:
+        window = or_(
+            and_(b.granularity == DAY, b.bucket_start >= first_day, b.bucket_start < last_day),
+            and_(b.granularity == HOUR, or_(
+                and_(b.bucket_start >= start, b.bucket_start < first_day),
+                and_(b.bucket_start >= last_day, b.bucket_start < end),
+            )),
+        )
+    else:
+        window = and_(b.granularity == HOUR, b.bucket_start >= start, b.bucket_start < end)
+    return _rollup(db, b, school_id, class_name, section_number, window)
+
+def histogram_rollup(db: Session, school_id=None, class_name=None, section_number=None):
+    """(okul, sınıf, section) -> 101 kutuluk sınav sayısı listesi (shard'lar toplanmış)."""
+    h = StatisticsHistogram
+    query = db.query(
+        h.school_id, h.class_name, h.section_number, h.bin, func.sum(h.exam_count)
+    )
+    if school_id is not None:
+        query = query.filter(h.school_id == school_id)
+    if class_name is not None:
+        query = query.filter(h.class_name == class_name)
+    if section_number is not None:
+        query = query.filter(h.section_number == section_number)
+    rows = query.group_by(h.school_id, h.class_name, h.section_number, h.bin).all()
+
+    histograms = {}
+    for school_id, class_name, section, bin, count in rows:
+        counts = histograms.setdefault((school_id, class_name, section), [0] * HISTOGRAM_BINS)
+        counts[bin] += count
+    return histograms
+
+def histogram_percentile(counts, q: float):
+    """Kutulardan q. yüzdelik (nearest-rank); boş histogramda None."""
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = max(1, math.ceil(q * total))
+    seen = 0
+    for bin, n in enumerate(counts):
+        seen += n
+        if seen >= rank:
+            return float(bin)
+    return float(len(counts) - 1)
+
+def histogram_distribution(counts):
+    """101 kutuyu 10'ar puanlık bantlara indirir: [0-9, 10-19, ..., 90-100]."""
+    bands = [0] * (HISTOGRAM_BINS // DISTRIBUTION_BAND)
+    for bin, n in enumerate(counts):
+        bands[min(bin // DISTRIBUTION_BAND, len(bands) - 1)] += n
+    return bands
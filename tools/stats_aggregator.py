@@ -0,0 +1,186 @@
+# tools/stats_aggregator.py
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from tools.database import SessionLocal
+from tools.statistics_utils import (
+    section_deltas, section_bins, merge_deltas, merge_counts, statistics_statements, pick_shard, rebuild_cutoff
+)
+
+logger = logging.getLogger(__name__)
+
+# "1" ise istatistikler gönderim transaction'ında değil, bellekte toplanıp topluca yazılır
+STATS_WRITE_BEHIND = os.getenv("STATS_WRITE_BEHIND", "1") == "1"
+# İki flush arasındaki en uzun süre (saniye)
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", "2"))
+# Bu kadar gönderim birikince süre dolmadan flush yapılır
+STATS_FLUSH_MAX_PENDING = int(os.getenv("STATS_FLUSH_MAX_PENDING", "200"))
+
+
+class StatisticsAggregator:
+    """
+    Write-behind istatistik toplayıcı.
+    process_results her gönderimin section bazlı değişimlerini (delta) add() ile bırakır;
+    aynı (school_id, class_name, section_number, saat) anahtarına gelen deltalar bellekte toplanır.
+    Arka plandaki thread bunları STATS_FLUSH_INTERVAL saniyede bir (ya da
+    STATS_FLUSH_MAX_PENDING gönderim birikince) tek transaction'da UPSERT ile yazar.
+    Böylece yoğun anlarda aynı sınıf satırları için her gönderim ayrı ayrı kilit beklemez.
+
+    Deltalar gönderimin end_time'ına göre ayrı tutulur: flush, son istatistik yeniden
+    hesaplamasının cutoff'undan önce kapanmış sınavların deltalarını yazmadan atar
+    (o sınavlar yeniden hesaplanan tablolarda zaten sayılmıştır).
+    """
+
+    def __init__(self, enabled=STATS_WRITE_BEHIND, flush_interval=STATS_FLUSH_INTERVAL,
+                 max_pending=STATS_FLUSH_MAX_PENDING):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # Aynı anda yalnızca bir flush çalışsın (thread + shutdown)
+        self._flush_lock = threading.Lock()
+        # end_time -> [deltalar, histogram deltaları, gönderim sayısı]
+        #   deltalar : (school_id, class_name, section_number, saat dilimi)
+        #              -> [correct, wrong, score_sum, exam_count]
+        #   histogram: (school_id, class_name, section_number, histogram kutusu) -> sınav sayısı
+        self._pending = {}
+        self._pending_submissions = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flushed_keys = 0
+        self.flushed_submissions = 0
+        self.dropped_submissions = 0
+        self.last_flush_at = None
+        self.last_flush_ms = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    @property
+    def pending_keys(self) -> int:
+        with self._lock:
+            return len({key for deltas, _, _ in self._pending.values() for key in deltas})
+
+    @property
+    def pending_submissions(self) -> int:
+        return self._pending_submissions
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-aggregator", daemon=True)
+        self._thread.start()
+        logger.info(f"Statistics aggregator started (interval={self.flush_interval}s, "
+                    f"max_pending={self.max_pending}).")
+
+    def stop(self):
+        """Thread'i durdurur ve bekleyen tüm deltaları yazar (kapanışta veri kaybı olmasın)."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+        self.flush()
+
+    def add(self, school_id, class_name, section_correct, section_wrong, section_scores, end_time=None):
+        end_time = end_time or datetime.utcnow()
+        deltas = section_deltas(school_id, class_name, section_correct, section_wrong, section_scores, end_time)
+        bins = section_bins(school_id, class_name, section_correct, section_wrong)
+        with self._lock:
+            self._merge(end_time, deltas, bins, 1)
+            self._pending_submissions += 1
+            if self._pending_submissions >= self.max_pending:
+                self._wake.set()
+
+    def _merge(self, end_time, deltas, bins, submissions):
+        entry = self._pending.setdefault(end_time, [{}, {}, 0])
+        merge_deltas(entry[0], deltas)
+        merge_counts(entry[1], bins)
+        entry[2] += submissions
+
+    def _merge_back(self, pending):
+        """Başarısız flush'taki deltaları bir sonraki denemeye geri koyar."""
+        with self._lock:
+            for end_time, (deltas, bins, submissions) in pending.items():
+                self._merge(end_time, deltas, bins, submissions)
+                self._pending_submissions += submissions
+
+    def flush(self) -> int:
+        """Bekleyen deltaları tek transaction'da yazar; yazılan delta anahtarı sayısını döner."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pending_submissions = 0
+            if not pending:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with SessionLocal() as db:
+                    cutoff = rebuild_cutoff(db)
+                    deltas, bins = {}, {}
+                    submissions = dropped = 0
+                    for end_time, (entry_deltas, entry_bins, entry_submissions) in pending.items():
+                        if cutoff is not None and end_time < cutoff:
+                            dropped += entry_submissions
+                            continue
+                        merge_deltas(deltas, entry_deltas)
+                        merge_counts(bins, entry_bins)
+                        submissions += entry_submissions
+                    # Her flush rastgele bir shard'a yazar; farklı worker'ların flush'ları çakışmaz
+                    for stmt in statistics_statements(deltas, pick_shard(), bins):
+                        db.execute(stmt)
+                    db.commit()
+            except Exception:
+                self.failed_flushes += 1
+                self._merge_back(pending)
+                raise
+
+            if dropped:
+                logger.info(f"Dropped statistics of {dropped} submissions already counted by a rebuild.")
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            self.last_flush_at = time.time()
+            self.flushes += 1
+            self.flushed_keys += len(deltas)
+            self.flushed_submissions += submissions
+            self.dropped_submissions += dropped
+            return len(deltas)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Statistics flush failed: {e}")
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "flush_interval": self.flush_interval,
+            "max_pending": self.max_pending,
+            "pending_keys": self.pending_keys,
+            "pending_submissions": self.pending_submissions,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flushed_keys": self.flushed_keys,
+            "flushed_submissions": self.flushed_submissions,
+            "dropped_submissions": self.dropped_submissions,
+            "last_flush_age": round(time.time() - self.last_flush_at, 3) if self.last_flush_at else None,
+            "last_flush_ms": round(self.last_flush_ms, 3) if self.last_flush_ms is not None else None,
+        }
+
+
+stats_aggregator = StatisticsAggregator()